@@ -1,30 +1,48 @@
 import os
+import sys
 import json
 import pickle
 import hashlib
+import threading
 from pathlib import Path
+from concurrent.futures import Future
 from datetime import datetime
-from typing import List, Dict, Optional
-import os
-import nest_asyncio
-from nemoguardrails import RailsConfig, LLMRails
-
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_community.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_openai import ChatOpenAI
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
+
 from dotenv import load_dotenv
 
+from lazy_loading import LazyEmbeddings, default_embeddings_factory, startup_profile
+from tracing import Tracer, tracer_from_env
+
+# Heavy dependencies (guardrails, LangChain community, FAISS, NumPy, PyTorch/ONNX models)
+# are imported where they are first needed to keep startup fast
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
 # Load environment variables
 load_dotenv()
 
+# The conversation moves to the next topic once the history is this long
+TOPIC_SWITCH_MESSAGES = 6
+
 class RAGAssistant:
     def __init__(self, 
                  document_path: str, 
                  cache_dir: str = ".cache",
                  model_name: str = "gpt-3.5-turbo",
-                 sessions_file: str = "conversation_sessions.json"):
+                 sessions_file: str = "conversation_sessions.json",
+                 llm=None,
+                 embeddings=None,
+                 rails=None,
+                 tracer: Optional[Tracer] = None,
+                 index_type: str = "flat",
+                 index_params: Optional[Dict] = None,
+                 retrieval: str = "dense",
+                 retrieval_budget_ms: Optional[float] = None,
+                 max_context_tokens: Optional[int] = None,
+                 speculate: bool = True,
+                 max_wasted_speculations: int = 3,
+                 embedding_backend: str = "torch"):
         """
         Initialize RAG-based AI Student Assistant
         
@@ -32,21 +50,67 @@ class RAGAssistant:
         :param cache_dir: Directory to store cached embeddings
         :param model_name: OpenAI model to use
         :param sessions_file: File to store conversation sessions
+        :param llm: Chat model to use instead of the shared LLM gateway
+        :param embeddings: Embeddings to use instead of the embedding_backend's model
+        :param rails: Guardrails to use instead of the ones loaded once from ./config_output_rails
+        :param tracer: Tracer for per-stage spans, configured from RAG_TRACE_* env vars by default
+        :param index_type: FAISS index to search with: "flat" (exact), "ivf" or "hnsw"
+        :param index_params: nlist/nprobe for IVF, M/efConstruction/efSearch for HNSW, and
+            storage ("float32", "fp16", "int8", "pq") with optional exact rerank for any index
+        :param retrieval: "dense" (FAISS only, the default) or "hybrid" (dense + BM25 with
+            reciprocal-rank fusion, see hybrid_retrieval.py compare_retrieval)
+        :param retrieval_budget_ms: Latency budget of hybrid retrieval, after which BM25 is cut short
+        :param max_context_tokens: Token budget of the retrieved context in prompts, None for no limit
+        :param speculate: Prepare the next topic's opening question in the background while the teacher types
+        :param max_wasted_speculations: Stop speculating after this many prepared questions went unused
+        :param embedding_backend: "torch" (sentence-transformers), "onnx" or "onnx-int8" (ONNX Runtime)
         """
+        if retrieval not in ("hybrid", "dense"):
+            raise ValueError(f"Unknown retrieval {retrieval!r}, expected 'hybrid' or 'dense'")
         self.document_path = document_path
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
         self.sessions_file = sessions_file
-        
-        # Initialize models
-        self.embeddings = HuggingFaceEmbeddings()
-        self.llm = ChatOpenAI(
-            model_name="gpt-4o-mini",
-            temperature=0.7
-        )
+        self.tracer = tracer or tracer_from_env(os.environ)
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        self.retrieval = retrieval
+        self.max_context_tokens = max_context_tokens
+        self.embedding_backend = embedding_backend
+        self.turn_traces = []
+        
+        # Models are built lazily so that constructing them never blocks startup
+        self.embeddings = embeddings or LazyEmbeddings(self._embeddings_factory(embedding_backend, cache_dir))
+        if isinstance(self.embeddings, LazyEmbeddings):
+            # The first question embeds a query, so start loading the model
+            # now, overlapping with loading the vectorstore
+            self.embeddings.warm_up()
+        self._llm = llm
+        self._rails = rails
+        self._init_lock = threading.Lock()
+        # LLMRails keeps the last call's state for explain(), so each instance
+        # runs one generate()/explain() pair at a time
+        self._rails_lock = threading.Lock()
+        # Speculation checks its questions on a rails instance of its own, so it
+        # never contends with the main thread's rails; injected rails are shared
+        self._speculation_rails = rails
+        self._speculation_rails_lock = self._rails_lock if rails is not None else threading.Lock()
+        
+        # Speculative preparation of the next topic's opening question
+        self.speculate = speculate
+        self.max_wasted_speculations = max_wasted_speculations
+        self.speculation_stats = {"started": 0, "served": 0, "wasted": 0}
+        self._speculation_lock = threading.Lock()
+        self._speculative_topic = None
+        self._speculative_future = None
         
         # Load or create vectorstore
-        self.vectorstore = self._initialize_knowledge_base()
+        with startup_profile.measure("initialize knowledge base"), \
+                self.tracer.turn("startup", index_type=index_type) as trace:
+            self.cache_path = self._get_cache_path()
+            self.vectorstore = self._initialize_knowledge_base()
+            self.retriever = self._initialize_retriever(retrieval_budget_ms) if retrieval == "hybrid" else None
+        self.turn_traces.append(trace.summary())
         
         # Define student persona and topics
         self.student_persona = """You are a curious and engaged student who is carefully studying a research paper. 
@@ -72,29 +136,129 @@ class RAGAssistant:
         self.session_start_time = datetime.now().isoformat()
         self.session_id = hashlib.md5(f"{self.session_start_time}".encode()).hexdigest()[:10]
 
-    def _initialize_knowledge_base(self) -> FAISS:
+    @property
+    def llm(self):
+        """Chat model, created on first use"""
+        if self._llm is None:
+            with self._init_lock:
+                if self._llm is None:
+                    with startup_profile.measure("import llm_gateway"):
+                        from llm_gateway import get_gateway
+                    with startup_profile.measure("create LLM gateway clients"):
+                        self._llm = get_gateway().chat_model(
+                            models={"openai": "gpt-4o-mini"},
+                            temperature=0.7
+                        )
+        return self._llm
+
+    @staticmethod
+    def _load_rails():
+        with startup_profile.measure("import nemoguardrails"):
+            from nemoguardrails import RailsConfig, LLMRails
+        with startup_profile.measure("load guardrails config"):
+            return LLMRails(RailsConfig.from_path("./config_output_rails"))
+
+    @property
+    def rails(self):
+        """Nemo Guardrails, loaded from ./config_output_rails on first use"""
+        if self._rails is None:
+            with self._init_lock:
+                if self._rails is None:
+                    self._rails = self._load_rails()
+        return self._rails
+
+    @property
+    def speculation_rails(self):
+        """Separate guardrails for the speculation thread, loaded on first use"""
+        if self._speculation_rails is None:
+            with self._init_lock:
+                if self._speculation_rails is None:
+                    self._speculation_rails = self._load_rails()
+        return self._speculation_rails
+
+    def warm_up(self):
+        """
+        Build the components the next turn needs in a background thread, so
+        they load while the teacher is typing instead of on the next turn
+
+        The speculation thread's rails are loaded last, before the first
+        speculation needs them.
+        """
+        def load():
+            with startup_profile.measure("background warm-up"):
+                self.rails
+                self.llm
+                if isinstance(self.embeddings, LazyEmbeddings):
+                    self.embeddings.get()
+                if self.speculate:
+                    self.speculation_rails
+
+        thread = threading.Thread(target=load, name="warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def _embeddings_factory(backend: str, cache_dir: str):
+        """Factory of the backend's embeddings; ONNX support is only imported when selected"""
+        if backend == "torch":
+            return default_embeddings_factory
+        from embedding_backends import embeddings_factory
+        return embeddings_factory(backend, cache_dir)
+
+    def _get_cache_path(self) -> Path:
+        """Cache file of the vectorstore for this document and index configuration"""
+        from vector_index import index_cache_tag
+
+        # Vectors differ between embedding backends; the PyTorch default has no tag
+        backend_tag = ""
+        if self.embedding_backend != "torch":
+            from embedding_backends import backend_cache_tag
+            backend_tag = backend_cache_tag(self.embedding_backend)
+        index_tag = index_cache_tag(self.index_type, self.index_params)
+        return self.cache_dir / f"vectorstore_{self._generate_cache_key()}{backend_tag}{index_tag}.pkl"
+
+    def _initialize_knowledge_base(self) -> "FAISS":
         """Initialize or load cached knowledge base"""
-        cache_key = self._generate_cache_key()
-        cache_path = self.cache_dir / f"vectorstore_{cache_key}.pkl"
+        from vector_index import configure_loaded_vectorstore
+
+        cache_path = self.cache_path
         
         if cache_path.exists():
             print("Loading knowledge base from cache...")
-            with open(cache_path, 'rb') as f:
-                return pickle.load(f)
+            with self.tracer.span("knowledge_base", cache_hit=True, index_type=self.index_type):
+                with open(cache_path, 'rb') as f:
+                    vectorstore = pickle.load(f)
+                # Queries go through this assistant's (lazy) embedder
+                vectorstore.embedding_function = self.embeddings
+                # Search parameters are not part of the cache key
+                return configure_loaded_vectorstore(
+                    vectorstore, self.index_type, self.index_params, cache_path.with_suffix(".f32")
+                )
         
         print("Creating new knowledge base...")
-        loader = PyMuPDFLoader(self.document_path)
-        documents = loader.load()
-        
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500, 
-            chunk_overlap=100
-        )
-        splits = text_splitter.split_documents(documents)
-        
-        vectorstore = FAISS.from_documents(
-            documents=splits, 
-            embedding=self.embeddings
+        with self.tracer.span("knowledge_base", cache_hit=False, index_type=self.index_type):
+            return self._build_knowledge_base(cache_path)
+
+    def _initialize_retriever(self, latency_budget_ms: Optional[float]):
+        """Load the BM25 index cached with the vectorstore and set up hybrid search"""
+        from hybrid_retrieval import HybridRetriever, load_or_build_bm25
+
+        bm25 = load_or_build_bm25(self.vectorstore, self.cache_path.with_suffix(".bm25"))
+        return HybridRetriever(self.vectorstore, bm25, latency_budget_ms=latency_budget_ms)
+
+    def _build_knowledge_base(self, cache_path: Path) -> "FAISS":
+        """Stream, split and embed the document, then cache the vectorstore"""
+        with startup_profile.measure("import ingestion pipeline"):
+            from ingestion import build_vectorstore
+            from vector_index import reindex_vectorstore
+            from hybrid_retrieval import load_or_build_bm25
+
+        vectorstore = build_vectorstore(self.document_path, self.embeddings)
+        if self.retrieval == "hybrid":
+            # Indexed from the same chunks, in the same order, as the vectors
+            load_or_build_bm25(vectorstore, cache_path.with_suffix(".bm25"))
+        vectorstore = reindex_vectorstore(
+            vectorstore, self.index_type, self.index_params, vectors_path=cache_path.with_suffix(".f32")
         )
         
         with open(cache_path, 'wb') as f:
@@ -111,8 +275,55 @@ class RAGAssistant:
     
     def _get_relevant_context(self, query: str) -> str:
         """Retrieve relevant context from knowledge base"""
-        results = self.vectorstore.similarity_search(query, k=3)
-        return "\n".join(doc.page_content for doc in results)
+        from context_assembly import assemble_context, estimate_tokens
+
+        with self.tracer.span("retrieval", k=3, method=self.retrieval) as span:
+            if self.retriever is not None:
+                results, stats = self.retriever.search(query, k=3)
+                span.set(**stats)
+            else:
+                results = self.vectorstore.similarity_search(query, k=3)
+            # Overlapping chunks are merged so repeated text is not sent twice
+            context = assemble_context(results, max_tokens=self.max_context_tokens)
+            span.set(results=len(results), context_chars=len(context), context_tokens=estimate_tokens(context))
+        return context
+
+    def _invoke_llm(self, prompt: str, kind: str):
+        """Call the LLM inside a traced generation span"""
+        with self.tracer.span("generation", kind=kind) as span:
+            response = self.llm.invoke(prompt)
+            span.record_llm_response(response)
+        return response
+
+    def _passes_rails(self, role: str, content: str, speculative: bool = False) -> bool:
+        """
+        Run a message through the guardrails
+
+        :param speculative: Check on the speculation thread's own rails
+        :return: False if the rails replied with their refusal message
+        """
+        stage = "input_rail" if role == "user" else "output_rail"
+        if speculative:
+            rails, lock = self.speculation_rails, self._speculation_rails_lock
+        else:
+            rails, lock = self.rails, self._rails_lock
+        with self.tracer.span(stage) as span:
+            # explain() reports the last generate() of this instance
+            with lock:
+                guardrail_response = rails.generate(messages=[{
+                    "role": role,
+                    "content": content
+                }])
+                span.record_rails_usage(rails)
+
+            if isinstance(guardrail_response, dict):
+                response_content = guardrail_response.get('content', "I'm sorry, I can't respond to that.")
+            else:
+                response_content = str(guardrail_response)
+
+            allowed = response_content != "I'm sorry, I can't respond to that."
+            span.set(verdict="allowed" if allowed else "blocked")
+        return allowed
     
     def _format_conversation_history(self) -> str:
         """Format recent conversation history"""
@@ -127,25 +338,104 @@ class RAGAssistant:
         if not self.current_topic:
             self.current_topic = self.topics[0]
         
-        context = self._get_relevant_context(self.current_topic)
+        if self.tracer.current_turn is None:
+            # Opening a conversation is a turn of its own
+            with self.tracer.turn("initial_question", topic=self.current_topic) as trace:
+                question = self._compose_initial_question(self.current_topic)
+            self.turn_traces.append(trace.summary())
+        else:
+            question = self._compose_initial_question(self.current_topic)
+        
+        # Store the initial question in conversation history
+        self.conversation_history.append({
+            "role": "assistant",
+            "content": question
+        })
+        
+        return question
+
+    def _compose_initial_question(self, topic: str, kind: str = "initial_question") -> str:
+        """Opening question for a topic; depends only on the topic, not on the conversation"""
+        context = self._get_relevant_context(topic)
         
-        prompt = f"""As a student studying this research paper, generate a thoughtful initial question about the {self.current_topic}.
+        prompt = f"""As a student studying this research paper, generate a thoughtful initial question about the {topic}.
         Use this context from the paper:
         {context}
         
         Frame a specific, focused question that shows engagement with the material and seeks deeper understanding.
         The question should be directly related to the content found in the context."""
         
-        response = self.llm.invoke(prompt)
-        
-        # Store the initial question in conversation history
-        self.conversation_history.append({
-            "role": "assistant",
-            "content": response.content
-        })
-        
+        response = self._invoke_llm(prompt, kind=kind)
         return response.content
 
+    def _speculate_next_topic(self):
+        """
+        Prepare the next topic's opening question in the background
+
+        Only starts when the next teacher reply will move the conversation to
+        the next topic, and stops for the session once max_wasted_speculations
+        prepared questions were thrown away.
+        """
+        if not self.speculate or self.current_topic not in self.topics:
+            return
+        index = self.topics.index(self.current_topic)
+        if index >= len(self.topics) - 1 or len(self.conversation_history) + 1 < TOPIC_SWITCH_MESSAGES:
+            return
+        topic = self.topics[index + 1]
+
+        with self._speculation_lock:
+            if self._speculative_topic == topic:
+                return
+            self._cancel_speculation_locked()
+            if self.speculation_stats["wasted"] >= self.max_wasted_speculations:
+                return
+            self._speculative_topic = topic
+            self._speculative_future = Future()
+            # A daemon thread, so quitting never waits for a question nobody will read
+            threading.Thread(target=self._run_speculation, args=(topic, self._speculative_future),
+                             name="speculate", daemon=True).start()
+            self.speculation_stats["started"] += 1
+
+    def _run_speculation(self, topic: str, future: Future):
+        """Generate and rail-check an opening question into future; runs on the speculation thread"""
+        # Nothing to do if the speculation was cancelled before the thread started
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            with self.tracer.turn("speculation", topic=topic):
+                question = self._compose_initial_question(topic, kind="speculative_initial_question")
+                future.set_result((question, self._passes_rails("assistant", question, speculative=True)))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _take_speculation(self, topic: str) -> Optional[Tuple[str, bool]]:
+        """The prepared (question, passed_rails) for a topic, waiting for it if still running"""
+        with self._speculation_lock:
+            if self._speculative_topic != topic:
+                return None
+            future = self._speculative_future
+            self._speculative_topic = self._speculative_future = None
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Speculative question for {topic} failed: {e}")
+            return None
+        with self._speculation_lock:
+            self.speculation_stats["served"] += 1
+        return result
+
+    def _cancel_speculation_locked(self):
+        if self._speculative_future is not None:
+            # A speculation that already started has cost an LLM call
+            if not self._speculative_future.cancel():
+                self.speculation_stats["wasted"] += 1
+        self._speculative_topic = self._speculative_future = None
+
+    def cancel_speculation(self):
+        """Drop any prepared question, e.g. when the conversation is reset"""
+        with self._speculation_lock:
+            self._cancel_speculation_locked()
+
     def generate_follow_up_question(self, teacher_response: str) -> str:
         """Generate a follow-up question based on teacher's response"""
         context = self._get_relevant_context(teacher_response)
@@ -171,7 +461,7 @@ class RAGAssistant:
         
         Keep your question concise and specific."""
         
-        response = self.llm.invoke(prompt)
+        response = self._invoke_llm(prompt, kind="follow_up_question")
         
         # Store the follow-up question in conversation history
         self.conversation_history.append({
@@ -188,23 +478,18 @@ class RAGAssistant:
         :param teacher_response: Teacher's input response
         :return: Student's next question or guardrails rejection message
         """
-        # Initialize Nemo Guardrails
-        rails = LLMRails(RailsConfig.from_path("./config_output_rails"))
-        
-        # Check input message against guardrails
-        input_guardrail_response = rails.generate(messages=[{
-            "role": "user",
-            "content": teacher_response
-        }])
-        
-        # Get the input response content
-        if isinstance(input_guardrail_response, dict):
-            input_response_content = input_guardrail_response.get('content', "I'm sorry, I can't respond to that.")
-        else:
-            input_response_content = str(input_guardrail_response)
+        with self.tracer.turn("teacher_turn", topic=self.current_topic) as trace:
+            reply = self._process_teacher_response(teacher_response)
+        self.turn_traces.append(trace.summary())
         
+        # Use the time the teacher spends typing to prepare the next topic
+        self._speculate_next_topic()
+        return reply
+
+    def _process_teacher_response(self, teacher_response: str) -> str:
+        """Guardrails-checked turn body, traced by process_teacher_response"""
         # If input guardrails blocked the message, store and return the rejection
-        if input_response_content == "I'm sorry, I can't respond to that.":
+        if not self._passes_rails("user", teacher_response):
             reject_response = "It seems you are talking about something not covered in the research paper. Could you please focus on the topics discussed in the research paper"
             self.conversation_history.append({
                 "role": "assistant",
@@ -219,24 +504,24 @@ class RAGAssistant:
         })
         
         # Check if we should move to next topic
-        if len(self.conversation_history) >= 6:  # After ~3 exchanges about current topic
+        if len(self.conversation_history) >= TOPIC_SWITCH_MESSAGES:  # After ~3 exchanges about current topic
             current_index = self.topics.index(self.current_topic)
             if current_index < len(self.topics) - 1:
                 self.current_topic = self.topics[current_index + 1]
-                next_question = self.generate_initial_question()
-                
-                # Check output against guardrails
-                output_guardrail_response = rails.generate(messages=[{
-                    "role": "assistant",
-                    "content": next_question
-                }])
-                
-                if isinstance(output_guardrail_response, dict):
-                    output_response_content = output_guardrail_response.get('content', "I'm sorry, I can't respond to that.")
+                speculation = self._take_speculation(self.current_topic)
+                if speculation is not None:
+                    # Prepared and rail-checked while the teacher was typing
+                    next_question, passed = speculation
+                    self.conversation_history.append({
+                        "role": "assistant",
+                        "content": next_question
+                    })
                 else:
-                    output_response_content = str(output_guardrail_response)
+                    next_question = self.generate_initial_question()
+                    # Check output against guardrails
+                    passed = self._passes_rails("assistant", next_question)
                 
-                if output_response_content == "I'm sorry, I can't respond to that.":
+                if not passed:
                     return "I apologize, but I need to reformulate my question. Could we continue discussing the current topic?"
                     
                 return next_question
@@ -244,20 +529,8 @@ class RAGAssistant:
         # Generate follow-up question
         follow_up = self.generate_follow_up_question(teacher_response)
         
-        # Check output against guardrails
-        output_guardrail_response = rails.generate(messages=[{
-            "role": "assistant",
-            "content": follow_up
-        }])
-        
-        # Get the output response content
-        if isinstance(output_guardrail_response, dict):
-            output_response_content = output_guardrail_response.get('content', "I'm sorry, I can't respond to that.")
-        else:
-            output_response_content = str(output_guardrail_response)
-        
         # If output violates guardrails, return a reformulated question
-        if output_response_content == "I'm sorry, I can't respond to that.":
+        if not self._passes_rails("assistant", follow_up):
             return "I apologize, but I need to reformulate my question. Could we continue discussing the current topic?"
         
         return follow_up
@@ -275,7 +548,9 @@ class RAGAssistant:
                 for msg in self.conversation_history 
                 if msg["role"] == "user"
                 for doc in self.vectorstore.similarity_search(msg["content"], k=1)
-            ]
+            ],
+            "traces": self.turn_traces,
+            "speculation": dict(self.speculation_stats)
         }
 
         # Load existing sessions or create new file
@@ -301,12 +576,17 @@ class RAGAssistant:
             self.save_session()
         
         # Reset conversation and session
+        self.cancel_speculation()
         self.conversation_history = []
+        self.turn_traces = []
         self.current_topic = None
         self.session_start_time = datetime.now().isoformat()
         self.session_id = hashlib.md5(f"{self.session_start_time}".encode()).hexdigest()[:10]
 
 def main():
+    # Print per-component import and initialization times with --profile-startup
+    profile_startup = "--profile-startup" in sys.argv[1:]
+
     # Example usage
     document_path = 'arxiv.pdf'  # Your knowledge base document
     assistant = RAGAssistant(
@@ -318,14 +598,21 @@ def main():
     print("Starting conversation about the research paper...")
     
     # Generate initial question
-    initial_question = assistant.generate_initial_question()
+    with startup_profile.measure("first question"):
+        initial_question = assistant.generate_initial_question()
     print("\nStudent:", initial_question)
+    if profile_startup:
+        startup_profile.report("Time to first question")
+
+    # Load the guardrails while the teacher types the first answer
+    assistant.warm_up()
     
     try:
         while True:
             teacher_input = input("\nTeacher: ").strip()
             
             if teacher_input.lower() == 'quit':
+                assistant.cancel_speculation()
                 session_data = assistant.save_session()
                 print(f"\nSession saved! Session ID: {session_data['session_id']}")
                 print(f"Session file: {assistant.sessions_file}")
@@ -341,6 +628,7 @@ def main():
             print("\nStudent:", next_question)
     
     except KeyboardInterrupt:
+        assistant.cancel_speculation()
         session_data = assistant.save_session()
         print(f"\nSession saved! Session ID: {session_data['session_id']}")
         print(f"Session file: {assistant.sessions_file}")
@@ -0,0 +1,494 @@
+import os
+import io
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import contextlib
+import subprocess
+from pathlib import Path
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# The evaluator scripts build ChatOpenAI clients at import time; the stubs
+# replace them before any request is made, so a placeholder key is enough
+os.environ.setdefault("OPENAI_API_KEY", "benchmark-stub")
+os.environ.setdefault("GROQ_API_KEY", "benchmark-stub")
+
+REFUSAL = "I'm sorry, I can't respond to that."
+
+WORDS = (
+    "model evaluation assertion grader criteria alignment human preference "
+    "prompt pipeline output validator experiment participant interface "
+    "study finding method baseline benchmark accuracy latency dataset "
+    "annotation feedback workflow report metric error analysis design"
+).split()
+
+
+def _count_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def _stable_seed(text: str) -> int:
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def _default_reply(prompt: str) -> str:
+    """Deterministic question-like reply derived from the prompt"""
+    rng = random.Random(_stable_seed(prompt))
+    words = re.findall(r"[a-zA-Z]{5,}", prompt) or WORDS
+    picked = [rng.choice(words).lower() for _ in range(3)]
+    return (
+        f"Could you explain how the {picked[0]} relates to the {picked[1]} "
+        f"described in the paper, and why the authors chose this {picked[2]}?"
+    )
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Deterministic local stand-in for ChatOpenAI / ChatGroq
+
+    Each call sleeps for a fixed latency plus the time it would take to
+    stream the reply at the configured token rate.
+    """
+    latency: float = 0.05
+    tokens_per_second: float = 200.0
+    reply_fn: Optional[Callable[[str], str]] = None
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+    def _reply(self, messages: List[BaseMessage]) -> Tuple[AIMessage, float]:
+        prompt = "\n".join(str(message.content) for message in messages)
+        text = self.reply_fn(prompt) if self.reply_fn else _default_reply(prompt)
+        prompt_tokens = _count_tokens(prompt)
+        completion_tokens = _count_tokens(text)
+        self.calls += 1
+        message = AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            }
+        )
+        return message, self.latency + completion_tokens / self.tokens_per_second
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message, delay = self._reply(messages)
+        time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message, delay = self._reply(messages)
+        await asyncio.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class StubEmbeddings(Embeddings):
+    """
+    Deterministic local stand-in for HuggingFaceEmbeddings
+
+    Vectors are normalised hashed bag-of-words, so texts sharing words are
+    still close to each other and retrieval behaves sensibly.
+    """
+
+    def __init__(self, dim: int = 768, latency_per_text: float = 0.0):
+        self.dim = dim
+        self.latency_per_text = latency_per_text
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            vector[_stable_seed(token) % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency_per_text * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency_per_text)
+        return self._embed(text)
+
+
+class StubRails:
+    """Local stand-in for LLMRails that blocks a fixed list of terms"""
+
+    def __init__(self, latency: float = 0.02, blocked_terms: Tuple[str, ...] = ("confidential", "secret")):
+        self.latency = latency
+        self.blocked_terms = blocked_terms
+        self.calls = 0
+
+    def generate(self, messages: List[Dict]) -> Dict:
+        time.sleep(self.latency)
+        self.calls += 1
+        content = messages[-1]["content"]
+        if any(term in content.lower() for term in self.blocked_terms):
+            content = REFUSAL
+        return {"role": "assistant", "content": content}
+
+
+def evaluator_reply(prompt: str) -> str:
+    """JSON reply accepted by both the RubricsScore and AspectCritic output parsers"""
+    rng = random.Random(_stable_seed(prompt))
+    return json.dumps({
+        "feedback": "The response covers the main points.",
+        "score": rng.randint(1, 5),
+        "reason": "The response is consistent with the context.",
+        "verdict": rng.randint(0, 1),
+    })
+
+
+def make_synthetic_pdf(path: Path, pages: int, seed: int = 0) -> Path:
+    """Write a PDF with `pages` pages of deterministic filler text"""
+    import fitz
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        paragraphs = [
+            " ".join(rng.choice(WORDS) for _ in range(60)).capitalize() + "."
+            for _ in range(6)
+        ]
+        text = f"Section {page_number + 1}\n\n" + "\n\n".join(paragraphs)
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=9)
+    doc.save(str(path))
+    doc.close()
+    return path
+
+
+def make_synthetic_dataset(num_conversations: int, turns: int = 5, seed: int = 0) -> List[Dict]:
+    """Build a dataset shaped like advanced_rag_dataset.json"""
+    rng = random.Random(seed)
+    topics = ["motivation", "problem statment", "comparison with existing models",
+              "proposed methodology", "experiments", "findings", "conclusions"]
+    dataset = []
+    for i in range(num_conversations):
+        topic = topics[i % len(topics)]
+        context = " ".join(rng.choice(WORDS) for _ in range(120))
+        messages = [{"role": "system", "content": f"Context: {context}"}]
+        for turn in range(turns):
+            messages.append({"role": "assistant", "content": _default_reply(f"{topic}-{i}-{turn}-q")})
+            messages.append({"role": "user", "content": " ".join(rng.choice(WORDS) for _ in range(80))})
+        dataset.append({
+            "topic": f"{topic} {i}",
+            "persona_pair": "student_teacher",
+            "initiator": "assistant",
+            "messages": messages,
+            "context": context,
+        })
+    return dataset
+
+
+def summarize_latencies(latencies: List[float]) -> Dict[str, float]:
+    values = np.asarray(latencies, dtype=np.float64)
+    return {
+        "count": int(values.size),
+        "mean_s": float(values.mean()),
+        "p50_s": float(np.percentile(values, 50)),
+        "p99_s": float(np.percentile(values, 99)),
+    }
+
+
+def bench_knowledge_base(workdir: Path, page_counts: List[int], embeddings: Embeddings) -> Dict:
+    """Time a cold knowledge-base build for documents of several sizes"""
+    from application import RAGAssistant
+
+    results = {}
+    for pages in page_counts:
+        pdf_path = make_synthetic_pdf(workdir / f"kb_{pages}.pdf", pages)
+        cache_dir = workdir / f"kb_cache_{pages}"
+        started = time.perf_counter()
+        assistant = RAGAssistant(
+            str(pdf_path),
+            cache_dir=str(cache_dir),
+            sessions_file=str(workdir / "sessions.json"),
+            llm=StubChatModel(),
+            embeddings=embeddings,
+            rails=StubRails(),
+        )
+        elapsed = time.perf_counter() - started
+        results[f"{pages}_pages"] = {
+            "build_s": elapsed,
+            "chunks": assistant.vectorstore.index.ntotal,
+            "pages_per_s": pages / elapsed,
+        }
+    return results
+
+
+def bench_turn_latency(workdir: Path, pages: int, turns: int, llm: StubChatModel,
+                       embeddings: Embeddings, rails: StubRails, speculate: bool = False) -> Dict:
+    """
+    Time RAGAssistant conversation turns end to end
+
+    :param speculate: Let the assistant prepare the next topic's question in the
+        background. Off by default, since the background thread competes with
+        the turns being timed.
+    """
+    from application import RAGAssistant
+
+    pdf_path = make_synthetic_pdf(workdir / f"turns_{pages}.pdf", pages)
+    assistant = RAGAssistant(
+        str(pdf_path),
+        cache_dir=str(workdir / "turn_cache"),
+        sessions_file=str(workdir / "sessions.json"),
+        llm=llm,
+        embeddings=embeddings,
+        rails=rails,
+        speculate=speculate,
+    )
+
+    started = time.perf_counter()
+    assistant.generate_initial_question()
+    initial_s = time.perf_counter() - started
+
+    rng = random.Random(1)
+    latencies = []
+    for _ in range(turns):
+        reply = " ".join(rng.choice(WORDS) for _ in range(40))
+        started = time.perf_counter()
+        assistant.process_teacher_response(reply)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    assistant.save_session()
+    save_s = time.perf_counter() - started
+    assistant.cancel_speculation()
+
+    return {
+        "speculate": speculate,
+        "initial_question_s": initial_s,
+        "turn": summarize_latencies(latencies),
+        "save_session_s": save_s,
+    }
+
+
+def bench_generate_dataset(workdir: Path, pages: int, sizes: List[int], llm: StubChatModel,
+                           embeddings: Embeddings) -> Dict:
+    """Measure generate_dataset throughput for several dataset sizes"""
+    from data_genration import CachedAdvancedRAGDatasetGenerator
+
+    pdf_path = make_synthetic_pdf(workdir / f"dataset_{pages}.pdf", pages)
+    generator = CachedAdvancedRAGDatasetGenerator(
+        str(pdf_path), cache_dir=str(workdir / "dataset_cache"), llm=llm, embeddings=embeddings
+    )
+    # generate_dataset samples topics without replacement, so larger sizes
+    # need a longer topic list
+    base_topics = list(generator.topics)
+    results = {}
+    for size in sizes:
+        generator.topics = [f"{base_topics[i % len(base_topics)]} {i}" for i in range(size)]
+        random.seed(size)
+        started = time.perf_counter()
+        dataset = generator.generate_dataset(num_conversations=size)
+        elapsed = time.perf_counter() - started
+        results[f"{size}_conversations"] = {
+            "total_s": elapsed,
+            "conversations_per_s": len(dataset) / elapsed,
+            "bytes": len(json.dumps(dataset)),
+        }
+    return results
+
+
+def bench_evaluators(sizes: List[int], llm: StubChatModel) -> Dict:
+    """Measure the throughput of the ragas evaluator scripts"""
+    from ragas.llms import LangchainLLMWrapper
+    import explanatory_depth
+    import fact_checking
+    from evaluation_runner import build_sample_table
+
+    explanatory_depth.rubric_metric.llm = LangchainLLMWrapper(llm)
+    fact_checking.default_evaluator_llm = lambda *args, **kwargs: LangchainLLMWrapper(llm)
+
+    results = {}
+    for size in sizes:
+        dataset = make_synthetic_dataset(size)
+        num_turns = len(build_sample_table(dataset))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            conversations = explanatory_depth.load_conversations(dataset)
+            asyncio.run(explanatory_depth.evaluate_all_conversations(conversations))
+            depth_s = time.perf_counter() - started
+
+            started = time.perf_counter()
+            fact_checking.evaluate_samples(dataset)
+            correctness_s = time.perf_counter() - started
+
+        results[f"{size}_conversations"] = {
+            "turns": num_turns,
+            "explanatory_depth_s": depth_s,
+            "explanatory_depth_turns_per_s": num_turns / depth_s,
+            "correctness_s": correctness_s,
+            "correctness_turns_per_s": num_turns / correctness_s,
+        }
+    return results
+
+
+def bench_embedding_backends(backends: List[str], num_chunks: int) -> Dict:
+    """
+    Time the real embedding models (not stubs) for single queries and bulk chunks
+
+    Downloads and exports the models on first use; ONNX exports are kept in .cache.
+    """
+    from embedding_backends import bench_backend
+
+    rng = random.Random(2)
+    chunks = [" ".join(rng.choice(WORDS) for _ in range(80)) for _ in range(num_chunks)]
+    return {backend: bench_backend(backend, chunks) for backend in backends}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(data: Any, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            flat.update(_flatten(value, f"{prefix}.{key}" if prefix else key))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        flat[prefix] = float(data)
+    return flat
+
+
+def compare_results(baseline: Dict, current: Dict, threshold: float = 0.10) -> List[Dict]:
+    """
+    Compare two benchmark result files metric by metric
+
+    Metrics ending in "_s" are times (lower is better); metrics ending in
+    "_per_s" are throughputs (higher is better). Others are reported only.
+
+    :param threshold: Relative change beyond which a metric counts as a regression
+    """
+    base = _flatten(baseline["results"])
+    new = _flatten(current["results"])
+    # Turn latencies with and without background speculation are not comparable
+    base_speculate = baseline["results"].get("turns", {}).get("speculate", False)
+    new_speculate = current["results"].get("turns", {}).get("speculate", False)
+    if base_speculate != new_speculate:
+        print(f"Turn benchmarks ran with speculate={base_speculate} and speculate={new_speculate}, "
+              "not comparing them")
+        base = {key: value for key, value in base.items() if not key.startswith("turns.")}
+    rows = []
+    for key in sorted(base.keys() & new.keys()):
+        old_value, new_value = base[key], new[key]
+        change = (new_value - old_value) / old_value if old_value else 0.0
+        if key.endswith("_per_s"):
+            regression = change < -threshold
+        elif key.endswith("_s"):
+            regression = change > threshold
+        else:
+            regression = False
+        rows.append({"metric": key, "baseline": old_value, "current": new_value,
+                     "change": change, "regression": regression})
+    return rows
+
+
+def run_benchmarks(args) -> Dict:
+    llm = StubChatModel(latency=args.llm_latency, tokens_per_second=args.tokens_per_second)
+    embeddings = StubEmbeddings(dim=args.embedding_dim, latency_per_text=args.embedding_latency)
+    rails = StubRails(latency=args.rails_latency)
+    suites = set(args.suites)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        if "kb" in suites:
+            print("Benchmarking knowledge-base build...")
+            results["knowledge_base"] = bench_knowledge_base(workdir, args.pages, embeddings)
+        if "turns" in suites:
+            print("Benchmarking RAGAssistant turns...")
+            results["turns"] = bench_turn_latency(
+                workdir, args.pages[0], args.turns, llm, embeddings, rails, speculate=args.speculate
+            )
+        if "dataset" in suites:
+            print("Benchmarking dataset generation...")
+            results["generate_dataset"] = bench_generate_dataset(
+                workdir, args.pages[0], args.dataset_sizes, llm, embeddings
+            )
+        if "evaluators" in suites:
+            print("Benchmarking evaluators...")
+            eval_llm = StubChatModel(
+                latency=args.llm_latency, tokens_per_second=args.tokens_per_second, reply_fn=evaluator_reply
+            )
+            results["evaluators"] = bench_evaluators(args.dataset_sizes, eval_llm)
+        if "embeddings" in suites:
+            print("Benchmarking embedding backends...")
+            results["embeddings"] = bench_embedding_backends(args.embedding_backends, args.embedding_chunks)
+
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks with stub LLM, rails and embeddings")
+    parser.add_argument("--suites", nargs="+", default=["kb", "turns", "dataset", "evaluators"],
+                        choices=["kb", "turns", "dataset", "evaluators", "embeddings"],
+                        help="The embeddings suite runs the real models and is not included by default")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100], help="Document sizes in pages")
+    parser.add_argument("--turns", type=int, default=20, help="Teacher turns for the latency benchmark")
+    parser.add_argument("--speculate", action="store_true",
+                        help="Keep background question speculation on while timing turns")
+    parser.add_argument("--dataset-sizes", type=int, nargs="+", default=[5, 20], help="Conversation counts")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Stub LLM latency per call (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Stub LLM output token rate")
+    parser.add_argument("--rails-latency", type=float, default=0.02, help="Stub rails latency per check (s)")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Stub embedding latency per text (s)")
+    parser.add_argument("--embedding-dim", type=int, default=768)
+    parser.add_argument("--embedding-backends", nargs="+", default=["torch", "onnx", "onnx-int8"],
+                        choices=["torch", "onnx", "onnx-int8"], help="Backends of the embeddings suite")
+    parser.add_argument("--embedding-chunks", type=int, default=256, help="Chunks embedded in bulk per backend")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the results")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"\nBenchmark results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare_results(baseline, report, args.threshold)
+        print(f"\nComparison against {baseline.get('commit') or args.compare}:")
+        for row in rows:
+            flag = "  REGRESSION" if row["regression"] else ""
+            print(f"{row['metric']:<60} {row['baseline']:>12.4f} -> {row['current']:>12.4f} "
+                  f"({row['change']:+.1%}){flag}")
+        if any(row["regression"] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import re
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+WORD_RE = re.compile(r"\w+")
+SENTENCE_END_RE = re.compile(r"[.!?]\s")
+
+MIN_SPAN_TOKENS = 20
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return (len(text) + 3) // 4
+
+
+class Span:
+    """Contiguous text of one page, built from one or more retrieved chunks"""
+
+    def __init__(self, text: str, metadata: Dict, relevance: float):
+        self.text = text
+        self.source = metadata.get("source")
+        self.page = metadata.get("page")
+        self.start = metadata.get("start_index")
+        self.relevance = relevance
+
+    @property
+    def end(self) -> Optional[int]:
+        return None if self.start is None else self.start + len(self.text)
+
+    def merge(self, other: "Span") -> bool:
+        """
+        Merge another chunk of the same page into this span if the two overlap or touch
+
+        With start indexes only a following chunk is merged; without them the
+        other chunk's text may overlap either end of this span.
+        """
+        if (self.source, self.page) != (other.source, other.page):
+            return False
+        if self.start is not None and other.start is not None:
+            if other.start > self.end:
+                return False
+            self.text += other.text[self.end - other.start:] if other.end > self.end else ""
+        else:
+            after = _text_overlap(self.text, other.text)
+            before = _text_overlap(other.text, self.text) if not after else 0
+            if after:
+                self.text += other.text[after:]
+            elif before:
+                self.text = other.text + self.text[before:]
+            else:
+                return False
+        self.relevance = max(self.relevance, other.relevance)
+        return True
+
+
+def _text_overlap(left: str, right: str, min_chars: int = 20) -> int:
+    """Length of the longest suffix of left that is a prefix of right"""
+    if right in left:
+        return len(right)
+    for size in range(min(len(left), len(right)) - 1, min_chars - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _merge_unordered(spans: List[Span]) -> List[Span]:
+    """Merge spans without start indexes, whatever order their chunks arrive in"""
+    merged: List[Span] = []
+    for span in spans:
+        # A span that grows may now overlap one merged earlier
+        while True:
+            target = next((m for m in merged if m.merge(span)), None)
+            if target is None:
+                merged.append(span)
+                break
+            merged.remove(target)
+            span = target
+    return merged
+
+
+def merge_chunks(documents: Sequence) -> List[Span]:
+    """
+    Merge overlapping or adjacent chunks of the same page into spans
+
+    Uses the start_index stored at ingestion time, falling back to matching
+    overlapping text for vectorstores built without it. Relevance decreases
+    with the retrieval rank of a span's best chunk.
+    """
+    spans = [
+        Span(doc.page_content, doc.metadata or {}, 1.0 / (rank + 1))
+        for rank, doc in enumerate(documents)
+    ]
+    indexed = sorted((s for s in spans if s.start is not None),
+                     key=lambda s: (str(s.source), s.page if s.page is not None else -1, s.start))
+    merged: List[Span] = []
+    for span in indexed:
+        if merged and merged[-1].merge(span):
+            continue
+        merged.append(span)
+    merged += _merge_unordered([s for s in spans if s.start is None])
+
+    # Drop spans whose text is already contained in another span
+    unique = []
+    for span in sorted(merged, key=lambda s: -len(s.text)):
+        if not any(span.text in kept.text for kept in unique):
+            unique.append(span)
+    return unique
+
+
+def _term_vectors(texts: List[str]) -> np.ndarray:
+    """L2-normalized bag-of-words vectors"""
+    vocabulary: Dict[str, int] = {}
+    rows = [[vocabulary.setdefault(w, len(vocabulary)) for w in WORD_RE.findall(text.lower())] for text in texts]
+    vectors = np.zeros((len(texts), max(len(vocabulary), 1)), dtype=np.float32)
+    for i, ids in enumerate(rows):
+        np.add.at(vectors[i], ids, 1.0)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def mmr_order(spans: List[Span], lambda_mult: float = 0.7) -> List[Span]:
+    """Order spans by maximal marginal relevance over their word overlap"""
+    if len(spans) < 2:
+        return list(spans)
+    similarity = _term_vectors([s.text for s in spans])
+    similarity = similarity @ similarity.T
+    relevance = np.array([s.relevance for s in spans])
+
+    selected = [int(np.argmax(relevance))]
+    remaining = [i for i in range(len(spans)) if i != selected[0]]
+    while remaining:
+        redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy
+        best = remaining[int(np.argmax(scores))]
+        selected.append(best)
+        remaining.remove(best)
+    return [spans[i] for i in selected]
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Cut text to a token budget, preferring to end on a sentence"""
+    limit = max_tokens * 4
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    ends = [m.end() for m in SENTENCE_END_RE.finditer(cut)]
+    return cut[:ends[-1]].rstrip() if ends and ends[-1] > limit // 2 else cut.rstrip()
+
+
+def assemble_context(documents: Sequence, max_tokens: Optional[int] = None,
+                     lambda_mult: float = 0.7, separator: str = "\n") -> str:
+    """
+    Build prompt context from retrieved chunks without repeated text
+
+    Overlapping chunks are merged into contiguous spans, duplicates are
+    dropped, spans are ordered by MMR and added until the token budget is
+    used up; the last one may be truncated.
+
+    :param documents: Retrieved LangChain documents, most relevant first
+    :param max_tokens: Token budget of the context, None for no limit
+    :param lambda_mult: MMR trade-off between relevance (1) and diversity (0)
+    :param separator: Text placed between spans
+    """
+    spans = mmr_order(merge_chunks(documents), lambda_mult)
+    parts = []
+    budget = max_tokens
+    for span in spans:
+        text = span.text
+        if budget is not None:
+            if parts:
+                budget -= estimate_tokens(separator)
+            # A few words of another span are not worth the tokens
+            if budget < MIN_SPAN_TOKENS:
+                break
+            text = _truncate(text, budget)
+            budget -= estimate_tokens(text)
+        parts.append(text)
+    return separator.join(parts)
@@ -3,36 +3,53 @@ import json
 import random
 import pickle
 import hashlib
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional
 from pathlib import Path
-from langchain_openai import ChatOpenAI
-from langchain_community.document_loaders import PyMuPDFLoader
 from langchain_community.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from dotenv import load_dotenv
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_groq import ChatGroq
+
+from context_assembly import assemble_context
+from embedding_backends import backend_cache_tag, embeddings_factory
+from ingestion import build_vectorstore
+from lazy_loading import LazyEmbeddings
+from llm_gateway import get_gateway
+from vector_index import configure_loaded_vectorstore, index_cache_tag, reindex_vectorstore
 
 # Load environment variables
 load_dotenv()
 
 class CachedAdvancedRAGDatasetGenerator:
-    def __init__(self, document_path: str, cache_dir: str = ".cache"):
+    def __init__(self, document_path: str, cache_dir: str = ".cache", llm=None, embeddings=None,
+                 index_type: str = "flat", index_params: Optional[Dict] = None,
+                 max_context_tokens: Optional[int] = None, embedding_backend: str = "torch"):
         """
         Initialize Advanced RAG Dataset Generator with caching
         
         :param document_path: Path to the source document
         :param cache_dir: Directory to store cached embeddings
+        :param llm: Chat model to use instead of the shared LLM gateway
+        :param embeddings: Embeddings to use instead of the embedding_backend's model
+        :param index_type: FAISS index to search with: "flat" (exact), "ivf" or "hnsw"
+        :param index_params: Index parameters, including storage ("float32", "fp16", "int8", "pq")
+            and optional exact rerank, see vector_index.resolve_index_params
+        :param max_context_tokens: Token budget of each conversation's context, None for no limit
+        :param embedding_backend: "torch" (sentence-transformers), "onnx" or "onnx-int8" (ONNX Runtime)
         """
         self.document_path = document_path
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        self.max_context_tokens = max_context_tokens
+        self.embedding_backend = embedding_backend
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
         
-        # Initialize models first
-        self.embeddings = HuggingFaceEmbeddings()
-        self.llm = ChatGroq(
-            model_name="llama3-8b-8192", 
-            api_key="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", 
+        # Initialize models first. The embedder is lazy so the cached vectorstore,
+        # which RAGAssistant also loads, never pickles a loaded model
+        self.embeddings = embeddings or LazyEmbeddings(embeddings_factory(embedding_backend, cache_dir))
+        self.llm = llm or get_gateway().chat_model(
+            models={"groq": "llama3-8b-8192"},
+            # The whole dataset comes from one model; fail instead of switching provider
+            providers=["groq"],
             temperature=0.7
         )
         
@@ -144,7 +161,9 @@ class CachedAdvancedRAGDatasetGenerator:
 
     def _get_cache_path(self) -> Path:
         """Get the full path for the cache file"""
-        return self.cache_dir / f"vectorstore_{self.cache_key}.pkl"
+        backend_tag = backend_cache_tag(self.embedding_backend)
+        index_tag = index_cache_tag(self.index_type, self.index_params)
+        return self.cache_dir / f"vectorstore_{self.cache_key}{backend_tag}{index_tag}.pkl"
 
     def _load_or_create_vectorstore(self) -> FAISS:
         """Load vectorstore from cache if it exists, otherwise create and cache it"""
@@ -153,21 +172,16 @@ class CachedAdvancedRAGDatasetGenerator:
         if cache_path.exists():
             print("Loading vectorstore from cache...")
             with open(cache_path, 'rb') as f:
-                return pickle.load(f)
+                vectorstore = pickle.load(f)
+            vectorstore.embedding_function = self.embeddings
+            return configure_loaded_vectorstore(
+                vectorstore, self.index_type, self.index_params, cache_path.with_suffix(".f32")
+            )
         
         print("Creating new vectorstore...")
-        loader = PyMuPDFLoader(self.document_path)
-        documents = loader.load()
-        
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500, 
-            chunk_overlap=100
-        )
-        splits = text_splitter.split_documents(documents)
-        
-        vectorstore = FAISS.from_documents(
-            documents=splits, 
-            embedding=self.embeddings
+        vectorstore = build_vectorstore(self.document_path, self.embeddings)
+        vectorstore = reindex_vectorstore(
+            vectorstore, self.index_type, self.index_params, vectors_path=cache_path.with_suffix(".f32")
         )
         
         with open(cache_path, 'wb') as f:
@@ -233,7 +247,7 @@ class CachedAdvancedRAGDatasetGenerator:
             )
             
             retrieval_results = self.vectorstore.similarity_search(topic, k=3)
-            context = " ".join([doc.page_content for doc in retrieval_results])
+            context = assemble_context(retrieval_results, max_tokens=self.max_context_tokens, separator=" ")
             
             conversation_messages = [
                 {"role": "system", "content": f"Context: {context}"},
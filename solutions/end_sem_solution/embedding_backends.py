@@ -0,0 +1,231 @@
+import time
+import argparse
+from pathlib import Path
+from functools import partial
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from lazy_loading import default_embeddings_factory, startup_profile
+
+# Model used by HuggingFaceEmbeddings() when no model is given
+DEFAULT_MODEL = "sentence-transformers/all-mpnet-base-v2"
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence-transformer embeddings run with ONNX Runtime on CPU
+
+    The model is exported to ONNX once (and optionally quantized to int8
+    with dynamic quantization) and cached on disk. Pooling and
+    normalization match sentence-transformers (mean pooling, L2 norm).
+    Requires optimum[onnxruntime] (pip install -r requirements-onnx.txt).
+    """
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, quantize: bool = False,
+                 cache_dir: str = ".cache", batch_size: int = 32, max_length: int = 384):
+        """
+        :param model_name: Hugging Face sentence-transformer model
+        :param quantize: Use int8 dynamically quantized weights
+        :param cache_dir: Where the exported ONNX models are kept
+        :param batch_size: Texts per ONNX Runtime call when embedding documents
+        :param max_length: Token limit per text (the model's max_seq_length)
+        """
+        try:
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError(
+                "The ONNX embedding backends need optimum[onnxruntime]: pip install -r requirements-onnx.txt"
+            ) from e
+
+        self.model_name = model_name
+        self.quantize = quantize
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+        model_dir = Path(cache_dir) / "onnx" / model_name.replace("/", "--")
+        if not (model_dir / "model.onnx").exists():
+            print(f"Exporting {model_name} to ONNX...")
+            model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+            model.save_pretrained(model_dir)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+
+        file_name = "model.onnx"
+        if quantize:
+            file_name = "model_quantized.onnx"
+            if not (model_dir / file_name).exists():
+                self._quantize(model_dir)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(model_dir, file_name=file_name)
+
+    @staticmethod
+    def _quantize(model_dir: Path):
+        from optimum.onnxruntime import ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        print(f"Quantizing {model_dir.name} to int8...")
+        quantizer = ORTQuantizer.from_pretrained(model_dir, file_name="model.onnx")
+        # AVX2 kernels run on every x86-64 node we have; weights only, no calibration data
+        config = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=model_dir, quantization_config=config)
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        inputs = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+        )
+        outputs = self.model(**inputs)
+        hidden = np.asarray(outputs.last_hidden_state, dtype=np.float32)
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = [self._embed(texts[i:i + self.batch_size]) for i in range(0, len(texts), self.batch_size)]
+        return np.concatenate(vectors).tolist() if vectors else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0].tolist()
+
+
+def _onnx_embeddings_factory(quantize: bool, cache_dir: str) -> Embeddings:
+    label = "int8 ONNX" if quantize else "ONNX"
+    with startup_profile.measure(f"load {label} embedding model"):
+        return OnnxEmbeddings(quantize=quantize, cache_dir=cache_dir)
+
+
+def embeddings_factory(backend: str = "torch", cache_dir: str = ".cache") -> Callable[[], Embeddings]:
+    """
+    Picklable zero-argument factory for a backend, for use with LazyEmbeddings
+
+    :raises ValueError: For unknown backends
+    """
+    if backend == "torch":
+        return default_embeddings_factory
+    if backend in ("onnx", "onnx-int8"):
+        return partial(_onnx_embeddings_factory, backend == "onnx-int8", cache_dir)
+    raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {EMBEDDING_BACKENDS}")
+
+
+def create_embeddings(backend: str = "torch", cache_dir: str = ".cache") -> Embeddings:
+    """Build the embeddings of a backend right away"""
+    return embeddings_factory(backend, cache_dir)()
+
+
+def backend_cache_tag(backend: str) -> str:
+    """Cache-file suffix for vectors produced by a backend; empty for the PyTorch default"""
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {EMBEDDING_BACKENDS}")
+    return "" if backend == "torch" else f"_{backend}"
+
+
+SAMPLE_TEXTS = [
+    "The participants graded LLM outputs while candidate assertions were generated and evaluated.",
+    "We propose a mixed-initiative approach to aligning LLM-assisted evaluations with human preferences.",
+    "Criteria drift: grading outputs helps users refine the criteria they grade against.",
+    "Assertions were implemented either as Python functions or as LLM-based evaluators.",
+    "Alignment is measured as the fraction of bad outputs flagged and good outputs passed.",
+    "Participants found it difficult to enumerate all criteria in their head.",
+    "The report card screen summarizes how well each assertion agrees with the user's grades.",
+    "Future work includes studying evaluation assistants in longer deployments.",
+]
+
+
+def _document_texts(document_path: Optional[str]) -> List[str]:
+    if not document_path:
+        return SAMPLE_TEXTS
+    from ingestion import iter_document_chunks
+    return [text for text, _ in iter_document_chunks(document_path)]
+
+
+def check_parity(texts: List[str], backend: str, reference: Optional[np.ndarray] = None,
+                 cache_dir: str = ".cache", k: int = 3) -> Dict[str, float]:
+    """
+    Compare a backend's vectors with the PyTorch vectors of the same texts
+
+    :return: Mean/min cosine similarity and the top-k neighbour overlap when
+        every text is used as a query against the others
+    """
+    if reference is None:
+        reference = np.asarray(create_embeddings("torch", cache_dir).embed_documents(texts))
+    vectors = np.asarray(create_embeddings(backend, cache_dir).embed_documents(texts))
+
+    def normalize(x):
+        return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+    reference, vectors = normalize(reference), normalize(vectors)
+    cosine = (reference * vectors).sum(axis=1)
+
+    k = min(k, len(texts) - 1)
+    overlap = 1.0
+    if k > 0:
+        def neighbours(x):
+            similarity = x @ x.T
+            np.fill_diagonal(similarity, -np.inf)
+            return np.argsort(-similarity, axis=1)[:, :k]
+        expected, found = neighbours(reference), neighbours(vectors)
+        overlap = float(np.mean([len(set(a) & set(b)) / k for a, b in zip(expected, found)]))
+
+    return {"mean_cosine": float(cosine.mean()), "min_cosine": float(cosine.min()), f"top_{k}_overlap": overlap}
+
+
+def bench_backend(backend: str, texts: List[str], queries: int = 50, cache_dir: str = ".cache") -> Dict[str, float]:
+    """Single-query latency and bulk chunk throughput of a backend"""
+    started = time.perf_counter()
+    embeddings = create_embeddings(backend, cache_dir)
+    load_s = time.perf_counter() - started
+
+    embeddings.embed_query(texts[0])  # warm-up
+    latencies = []
+    for i in range(queries):
+        started = time.perf_counter()
+        embeddings.embed_query(texts[i % len(texts)][:200])
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    embeddings.embed_documents(texts)
+    bulk_s = time.perf_counter() - started
+
+    return {
+        "load_s": load_s,
+        "query_p50_s": float(np.percentile(latencies, 50)),
+        "query_p99_s": float(np.percentile(latencies, 99)),
+        "bulk_s": bulk_s,
+        "chunks_per_s": len(texts) / bulk_s,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and benchmark the embedding backends")
+    parser.add_argument("command", choices=["parity", "bench"])
+    parser.add_argument("--document", help="PDF whose chunks are embedded; built-in sample sentences by default")
+    parser.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"], choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="Parity fails below this minimum cosine")
+    parser.add_argument("--cache-dir", default=".cache")
+    args = parser.parse_args()
+
+    texts = _document_texts(args.document)
+    print(f"{len(texts)} texts")
+
+    if args.command == "parity":
+        reference = np.asarray(create_embeddings("torch", args.cache_dir).embed_documents(texts))
+        failed = False
+        for backend in args.backends:
+            result = check_parity(texts, backend, reference, args.cache_dir)
+            ok = result["min_cosine"] >= args.min_cosine
+            failed |= not ok
+            print(f"{backend:<10} {'OK  ' if ok else 'FAIL'} " + "  ".join(f"{k}={v:.5f}" for k, v in result.items()))
+        raise SystemExit(1 if failed else 0)
+
+    for backend in ["torch"] + [b for b in args.backends if b != "torch"]:
+        result = bench_backend(backend, texts, cache_dir=args.cache_dir)
+        print(f"{backend:<10} load {result['load_s']:6.2f}s  query p50 {result['query_p50_s'] * 1000:7.2f} ms  "
+              f"p99 {result['query_p99_s'] * 1000:7.2f} ms  bulk {result['chunks_per_s']:8.1f} chunks/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import json
+import math
+import time
+import asyncio
+import argparse
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+from ragas.dataset_schema import SingleTurnSample
+
+# Load environment variables
+load_dotenv()
+
+EXPLANATORY_DEPTH_RUBRICS = {
+    "score1_description": "The response is superficial, lacks detail, and fails to adequately explain the concepts. There is minimal elaboration on key points and no clear structure to the explanation.",
+    "score2_description": "The response provides basic explanations but lacks depth in critical areas. Some concepts are explained but without sufficient detail or real-world connections. The structure is basic and some key points are missing.",
+    "score3_description": "The response offers clear explanations with moderate depth. Most key concepts are covered with some supporting details and examples. The explanation has a logical structure but could benefit from more elaborate connections or practical applications.",
+    "score4_description": "The response provides comprehensive explanations with good depth. Concepts are well-explained with relevant examples and clear connections. The explanation is well-structured and includes practical applications or implications.",
+    "score5_description": "The response demonstrates exceptional explanatory depth with thorough, nuanced explanations. Complex concepts are broken down effectively with rich examples, clear analogies, and practical applications. The explanation is exceptionally well-structured with clear transitions and connections between ideas."
+}
+CORRECTNESS_DEFINITION = "Check correctness of the respone wrt to retreived context "
+QUERY_GROUNDING_DEFINITION = "Are the queries grounded in research. compare th queries with the given topic and context"
+
+
+def build_sample_table(json_data: List[Dict]) -> pd.DataFrame:
+    """
+    Flatten the generated dataset into one row per question/answer turn
+
+    A turn is an assistant (student) question directly followed by a user
+    (teacher) answer, as in the individual evaluator scripts.
+    """
+    rows = []
+    for conversation_id, conversation in enumerate(json_data):
+        messages = conversation['messages']
+        turn = 0
+        for i in range(len(messages) - 1):
+            if messages[i]['role'] == 'assistant' and messages[i + 1]['role'] == 'user':
+                rows.append({
+                    'conversation_id': conversation_id,
+                    'topic': conversation['topic'],
+                    'turn': turn,
+                    'question': messages[i]['content'],
+                    'answer': messages[i + 1]['content'],
+                    'context': conversation['context'],
+                })
+                turn += 1
+    return pd.DataFrame(rows, columns=['conversation_id', 'topic', 'turn', 'question', 'answer', 'context'])
+
+
+def turn_sample(row: Dict) -> SingleTurnSample:
+    """The student's question answered by the teacher, grounded in the retrieved context"""
+    return SingleTurnSample(
+        user_input=row['question'],
+        retrieved_contexts=[row['context']],
+        response=row['answer']
+    )
+
+
+def query_sample(row: Dict) -> SingleTurnSample:
+    """The student's question on its own, judged against its topic and context"""
+    return SingleTurnSample(
+        user_input=f"Topic: {row['topic']}\n{row['question']}",
+        retrieved_contexts=[row['context']],
+        response="Evaluating query grounding"  # Placeholder response
+    )
+
+
+@dataclass
+class MetricPlugin:
+    """
+    A metric the runner evaluates on every sample
+
+    :param name: Column name in the results file
+    :param build: Creates the ragas metric from the evaluator LLM
+    :param to_sample: Builds the ragas sample from a row of the sample table
+    :param judge_model: Evaluator model of this metric, None for the runner's default
+    """
+    name: str
+    build: Callable[[Any], Any]
+    to_sample: Callable[[Dict], SingleTurnSample] = turn_sample
+    judge_model: Optional[str] = None
+
+
+METRICS: Dict[str, MetricPlugin] = {}
+
+
+def register_metric(plugin: MetricPlugin) -> MetricPlugin:
+    """Make a metric available to the runner under plugin.name"""
+    METRICS[plugin.name] = plugin
+    return plugin
+
+
+def _explanatory_depth(llm):
+    from ragas.metrics import RubricsScore
+    return RubricsScore(name="explanatory_depth", llm=llm, rubrics=EXPLANATORY_DEPTH_RUBRICS)
+
+
+def _correctness(llm):
+    from ragas.metrics import AspectCritic
+    return AspectCritic(name="correctness", definition=CORRECTNESS_DEFINITION, llm=llm)
+
+
+def _query_grounding(llm):
+    from ragas.metrics import AspectCritic
+    return AspectCritic(name="query_grounding", definition=QUERY_GROUNDING_DEFINITION, llm=llm)
+
+
+register_metric(MetricPlugin("explanatory_depth", _explanatory_depth))
+register_metric(MetricPlugin("correctness", _correctness))
+# paper_consistency.py has always judged query grounding with gpt-4o
+register_metric(MetricPlugin("query_grounding", _query_grounding, to_sample=query_sample, judge_model="gpt-4o"))
+
+
+def default_evaluator_llm(model: str = "gpt-4", provider: str = "openai"):
+    """
+    Evaluator LLM sent through the shared LLM gateway
+
+    The judge is pinned to one provider: scores from different judge models
+    are not comparable, so a failing provider fails the evaluation instead
+    of falling over to another one.
+    """
+    from ragas.llms import LangchainLLMWrapper
+    from llm_gateway import get_gateway
+
+    return LangchainLLMWrapper(get_gateway().chat_model(models={provider: model}, providers=[provider]))
+
+
+class JudgeRecorder(BaseCallbackHandler):
+    """Collect the provider and model that answered each LLM call of an evaluation"""
+
+    def __init__(self):
+        self.models = set()
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "response_metadata", None) or {}
+                model = metadata.get("model_name") or metadata.get("model")
+                if model:
+                    provider = metadata.get("provider")
+                    self.models.add(f"{provider}:{model}" if provider else model)
+
+    @property
+    def judge(self) -> Optional[str]:
+        return ",".join(sorted(self.models)) or None
+
+
+async def _score(plugin: MetricPlugin, metric, row: Dict, semaphore: asyncio.Semaphore):
+    recorder = JudgeRecorder()
+    async with semaphore:
+        try:
+            score = await metric.single_turn_ascore(plugin.to_sample(row), callbacks=[recorder])
+            return score, None, recorder.judge
+        except Exception as e:
+            return math.nan, f"{type(e).__name__}: {e}", recorder.judge
+
+
+async def evaluate_samples(samples: pd.DataFrame, metric_names: List[str], model: str = "gpt-4",
+                           provider: str = "openai", concurrency: int = 8,
+                           llm_factory: Callable[[str, str], Any] = default_evaluator_llm) -> pd.DataFrame:
+    """
+    Score every sample with every metric in one pass
+
+    All (sample, metric) pairs run concurrently, at most `concurrency` LLM
+    evaluations at a time. Failed evaluations are stored as NaN with the
+    error in <metric>_error; <metric>_judge records the model that answered.
+
+    :param model: Judge of the metrics without a judge_model of their own
+    :param provider: Gateway provider every judge is pinned to
+    :param llm_factory: Creates the evaluator LLM for a model and provider
+    :return: The sample table with one score column per metric
+    """
+    plugins = [METRICS[name] for name in metric_names]
+    llms = {}
+    for plugin in plugins:
+        judge_model = plugin.judge_model or model
+        if judge_model not in llms:
+            llms[judge_model] = llm_factory(judge_model, provider)
+    metrics = [plugin.build(llms[plugin.judge_model or model]) for plugin in plugins]
+    semaphore = asyncio.Semaphore(concurrency)
+    rows = samples.to_dict('records')
+
+    tasks = [
+        _score(plugin, metric, row, semaphore)
+        for row in rows
+        for plugin, metric in zip(plugins, metrics)
+    ]
+    outcomes = await asyncio.gather(*tasks)
+
+    results = samples.copy()
+    for index, plugin in enumerate(plugins):
+        outcome = outcomes[index::len(plugins)]
+        results[plugin.name] = [score for score, _, _ in outcome]
+        results[f"{plugin.name}_error"] = [error for _, error, _ in outcome]
+        results[f"{plugin.name}_judge"] = [judge for _, _, judge in outcome]
+    return results
+
+
+def write_results(results: pd.DataFrame, path: str) -> str:
+    """Write a Parquet file, falling back to CSV when no Parquet engine is installed"""
+    if path.endswith(".parquet"):
+        try:
+            results.to_parquet(path, index=False)
+            return path
+        except ImportError:
+            path = str(Path(path).with_suffix(".csv"))
+            print(f"No Parquet engine installed (pip install pyarrow), writing {path} instead")
+    results.to_csv(path, index=False)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the generated dataset with several metrics in one pass")
+    parser.add_argument("--dataset", default="advanced_rag_dataset.json")
+    parser.add_argument("--metrics", nargs="+", default=list(METRICS), choices=list(METRICS))
+    parser.add_argument("--output", default="evaluation_results.parquet", help="Parquet or CSV results file")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent metric evaluations")
+    parser.add_argument("--model", default="gpt-4", help="Evaluator (judge) model of metrics without their own")
+    parser.add_argument("--provider", default="openai", help="Gateway provider the judge is pinned to")
+    args = parser.parse_args()
+
+    print("Loading dataset...")
+    with open(args.dataset, 'r') as f:
+        samples = build_sample_table(json.load(f))
+    print(f"{len(samples)} turns from {samples['conversation_id'].nunique()} conversations")
+
+    async def run():
+        from llm_gateway import get_gateway
+        try:
+            return await evaluate_samples(samples, args.metrics, args.model, args.provider, args.concurrency)
+        finally:
+            await get_gateway().aclose()
+
+    started = time.perf_counter()
+    results = asyncio.run(run())
+    print(f"Evaluated {len(results)} turns x {len(args.metrics)} metrics in {time.perf_counter() - started:.1f}s")
+
+    path = write_results(results, args.output)
+    print(f"\nResults have been saved to '{path}'")
+
+    print("\nAverage scores per topic:")
+    print(results.groupby('topic')[args.metrics].mean())
+    for name in args.metrics:
+        failures = results[f"{name}_error"].notna().sum()
+        if failures:
+            print(f"Warning: {failures} {name} evaluations failed")
+        judges = results[f"{name}_judge"].dropna().unique()
+        if len(judges) > 1:
+            print(f"Warning: {name} was scored by several judges: {', '.join(judges)}")
+
+
+if __name__ == "__main__":
+    main()
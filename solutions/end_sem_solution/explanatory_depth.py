@@ -1,61 +1,24 @@
-import os
 import pandas as pd
-from ragas import EvaluationDataset
-from ragas.llms import LangchainLLMWrapper
-from langchain_openai import ChatOpenAI
 from ragas.metrics import RubricsScore
 from ragas.dataset_schema import SingleTurnSample
-from ragas import evaluate
 import asyncio
 import json
 from typing import List, Dict, Tuple
 from dotenv import load_dotenv
 
+from evaluation_runner import EXPLANATORY_DEPTH_RUBRICS, build_sample_table, default_evaluator_llm, turn_sample
+
 # Load environment variables
 load_dotenv()
-def create_conversation_samples(conversation_data: Dict) -> List[SingleTurnSample]:
-    """Create samples for each turn in a conversation."""
-    samples = []
-    messages = conversation_data['messages']
-    
-    # Filter out system messages and pair assistant questions with user responses
-    conversation_turns = []
-    
-    try:
-        # Print debugging information
-        print(f"\nProcessing conversation: {conversation_data['topic']}")
-        print(f"Number of messages: {len(messages)}")
-        
-        for i in range(len(messages)):
-            if messages[i]['role'] == 'assistant' and i + 1 < len(messages) and messages[i + 1]['role'] == 'user':
-                conversation_turns.append((messages[i], messages[i+1]))
-        
-        print(f"Number of valid turns found: {len(conversation_turns)}")
-        
-        for question_msg, answer_msg in conversation_turns:
-            sample = SingleTurnSample(
-                user_input=question_msg['content'],
-                retrieved_contexts=[conversation_data['context']],
-                response=answer_msg['content']
-            )
-            samples.append(sample)
-            
-    except Exception as e:
-        print(f"Error processing conversation {conversation_data.get('topic', 'unknown')}: {str(e)}")
-    
-    return samples
-
 def load_conversations(json_data: List[Dict]) -> Dict[str, List[SingleTurnSample]]:
     """Load all conversations and organize them by topic."""
     conversations = {}
+    for row in build_sample_table(json_data).to_dict('records'):
+        conversations.setdefault(row['topic'], []).append(turn_sample(row))
     for conversation in json_data:
         topic = conversation['topic']
         if topic not in conversations:
             conversations[topic] = []
-        samples = create_conversation_samples(conversation)
-        if samples:  # Only add if we got valid samples
-            conversations[topic].extend(samples)
-        else:
             print(f"Warning: No valid samples extracted for topic: {topic}")
     
     # Print summary of loaded conversations
@@ -123,17 +86,11 @@ async def evaluate_all_conversations(conversations: Dict[str, List[SingleTurnSam
     return results
 
 # Initialize the evaluator and metric (moved outside main for clarity)
-evaluator_llm = LangchainLLMWrapper(ChatOpenAI(model="gpt-4"))
+evaluator_llm = default_evaluator_llm("gpt-4")
 rubric_metric = RubricsScore(
     name="explanatory_depth",
     llm=evaluator_llm,
-    rubrics={
-        "score1_description": "The response is superficial, lacks detail, and fails to adequately explain the concepts. There is minimal elaboration on key points and no clear structure to the explanation.",
-        "score2_description": "The response provides basic explanations but lacks depth in critical areas. Some concepts are explained but without sufficient detail or real-world connections. The structure is basic and some key points are missing.",
-        "score3_description": "The response offers clear explanations with moderate depth. Most key concepts are covered with some supporting details and examples. The explanation has a logical structure but could benefit from more elaborate connections or practical applications.",
-        "score4_description": "The response provides comprehensive explanations with good depth. Concepts are well-explained with relevant examples and clear connections. The explanation is well-structured and includes practical applications or implications.",
-        "score5_description": "The response demonstrates exceptional explanatory depth with thorough, nuanced explanations. Complex concepts are broken down effectively with rich examples, clear analogies, and practical applications. The explanation is exceptionally well-structured with clear transitions and connections between ideas."
-    }
+    rubrics=EXPLANATORY_DEPTH_RUBRICS
 )
 
 # Main execution
@@ -1,54 +1,34 @@
-import os
 import pandas as pd
 import json
 from ragas import EvaluationDataset
-from ragas.llms import LangchainLLMWrapper
-from langchain_openai import ChatOpenAI
 from ragas.metrics import AspectCritic
-from ragas.dataset_schema import SingleTurnSample
 from ragas import evaluate
 from typing import List, Dict
 from dotenv import load_dotenv
 
+from evaluation_runner import CORRECTNESS_DEFINITION, build_sample_table, default_evaluator_llm, turn_sample
+
 # Load environment variables
 load_dotenv()
 
-def create_conversation_samples(conversation_data: Dict) -> List[SingleTurnSample]:
-    """Create samples for each turn in a conversation."""
-    samples = []
-    messages = conversation_data['messages']
-    conversation_turns = []
-    
-    for i in range(len(messages)):
-        if messages[i]['role'] == 'assistant' and i + 1 < len(messages) and messages[i + 1]['role'] == 'user':
-            conversation_turns.append((messages[i], messages[i+1]))
-    
-    for question_msg, answer_msg in conversation_turns:
-        sample = SingleTurnSample(
-            user_input=question_msg['content'],
-            retrieved_contexts=[conversation_data['context']],
-            response=answer_msg['content']
-        )
-        samples.append(sample)
-    
-    return samples
-
 def evaluate_samples(json_data: List[Dict]) -> pd.DataFrame:
     """Evaluate all samples using AspectCritic."""
     # Initialize critics
-    evaluator_llm = LangchainLLMWrapper(ChatOpenAI(model="gpt-4"))
+    evaluator_llm = default_evaluator_llm("gpt-4")
     critic = AspectCritic(
         name="correctness",
-        definition="Check correctness of the respone wrt to retreived context ",
+        definition=CORRECTNESS_DEFINITION,
         llm=evaluator_llm,
     )
     
+    table = build_sample_table(json_data)
     all_results = []
     for sample_idx, conversation in enumerate(json_data):
         print(f"\nProcessing sample {sample_idx + 1}/{len(json_data)}: {conversation['topic']}")
         
         # Get turns for this sample
-        turns = create_conversation_samples(conversation)
+        rows = table[table['conversation_id'] == sample_idx].to_dict('records')
+        turns = [turn_sample(row) for row in rows]
         if not turns:
             continue
             
@@ -0,0 +1,286 @@
+import re
+import json
+import math
+import time
+import pickle
+import argparse
+from pathlib import Path
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be been but by can do does for from has have how in into is it its "
+    "of on or that the their them then there these they this to was were what when where "
+    "which while who why will with would you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords, with plural "s" stripped"""
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index stored as flat NumPy arrays
+
+    Postings of term t are doc_ids[offsets[t]:offsets[t + 1]] with their
+    precomputed BM25 term weights, so a query only multiplies by the IDF and
+    sums. Document positions match the vectorstore's FAISS positions.
+    """
+
+    def __init__(self, texts: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        """
+        :param texts: Chunk texts in FAISS index order
+        :param k1: Term-frequency saturation
+        :param b: Document-length normalization
+        """
+        counts = [Counter(tokenize(text)) for text in texts]
+        doc_lengths = np.array([sum(c.values()) for c in counts], dtype=np.float32)
+        avg_length = float(doc_lengths.mean()) if len(counts) and doc_lengths.mean() > 0 else 1.0
+
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc_id, counter in enumerate(counts):
+            for term, tf in counter.items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        self.vocabulary: Dict[str, int] = {}
+        offsets = [0]
+        doc_ids, weights, idf = [], [], []
+        for term_id, (term, entries) in enumerate(sorted(postings.items())):
+            self.vocabulary[term] = term_id
+            ids = np.array([doc_id for doc_id, _ in entries], dtype=np.int64)
+            tf = np.array([tf for _, tf in entries], dtype=np.float32)
+            norm = k1 * (1 - b + b * doc_lengths[ids] / avg_length)
+            doc_ids.append(ids)
+            weights.append(tf * (k1 + 1) / (tf + norm))
+            df = len(entries)
+            idf.append(math.log(1 + (len(counts) - df + 0.5) / (df + 0.5)))
+            offsets.append(offsets[-1] + df)
+
+        self.num_docs = len(counts)
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.doc_ids = np.concatenate(doc_ids) if doc_ids else np.empty(0, dtype=np.int64)
+        self.weights = np.concatenate(weights).astype(np.float32) if weights else np.empty(0, dtype=np.float32)
+        self.idf = np.array(idf, dtype=np.float32)
+
+    def search(self, query: str, k: int, deadline: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k document positions and scores for a query
+
+        Terms are scored rarest first; once time.perf_counter() passes the
+        deadline the remaining (most common, least informative) terms are skipped.
+        """
+        term_ids = [self.vocabulary[t] for t in set(tokenize(query)) if t in self.vocabulary]
+        term_ids.sort(key=lambda t: -self.idf[t])
+
+        ids, scores = [], []
+        for term_id in term_ids:
+            if deadline is not None and ids and time.perf_counter() > deadline:
+                break
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            ids.append(self.doc_ids[start:end])
+            scores.append(self.weights[start:end] * self.idf[term_id])
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        unique, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        top = np.argsort(-totals, kind="stable")[:k]
+        return unique[top], totals[top]
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], rrf_k: int = 60,
+                           weights: Optional[List[float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fuse ranked id lists by summing weight / (rrf_k + rank)
+
+    :return: Fused ids and scores, best first
+    """
+    rankings = [np.asarray(ranking, dtype=np.int64) for ranking in rankings]
+    weights = weights or [1.0] * len(rankings)
+    ids = np.concatenate(rankings)
+    if not ids.size:
+        return ids, np.empty(0)
+    contributions = np.concatenate([
+        weight / (rrf_k + np.arange(1, len(ranking) + 1))
+        for ranking, weight in zip(rankings, weights)
+    ])
+    unique, inverse = np.unique(ids, return_inverse=True)
+    fused = np.bincount(inverse, weights=contributions)
+    order = np.argsort(-fused, kind="stable")
+    return unique[order], fused[order]
+
+
+def vectorstore_texts(vectorstore) -> List[str]:
+    """Chunk texts of a LangChain FAISS vectorstore in index order"""
+    return [
+        vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]).page_content
+        for i in range(len(vectorstore.index_to_docstore_id))
+    ]
+
+
+def load_or_build_bm25(vectorstore, path: Path) -> BM25Index:
+    """Load the BM25 index cached next to a vectorstore, building it if missing"""
+    if path.exists():
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    bm25 = BM25Index(vectorstore_texts(vectorstore))
+    with open(path, 'wb') as f:
+        pickle.dump(bm25, f)
+    return bm25
+
+
+class HybridRetriever:
+    """Dense FAISS search fused with BM25 by reciprocal-rank fusion"""
+
+    def __init__(self, vectorstore, bm25: BM25Index, candidates: int = 20, rrf_k: int = 60,
+                 latency_budget_ms: Optional[float] = None):
+        """
+        :param vectorstore: LangChain FAISS vectorstore
+        :param bm25: BM25 index over the same chunks in the same order
+        :param candidates: Results taken from each retriever before fusion
+        :param rrf_k: Rank offset of reciprocal-rank fusion
+        :param latency_budget_ms: Time after which BM25 scoring is cut short;
+            when the dense search alone uses it up, only dense results are returned
+        """
+        self.vectorstore = vectorstore
+        self.bm25 = bm25
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.latency_budget_ms = latency_budget_ms
+
+    def dense_search(self, query: str, n: int) -> np.ndarray:
+        vector = np.array([self.vectorstore.embedding_function.embed_query(query)], dtype=np.float32)
+        if getattr(self.vectorstore, "_normalize_L2", False):
+            vector /= np.linalg.norm(vector, axis=1, keepdims=True)
+        _, ids = self.vectorstore.index.search(vector, n)
+        return ids[0][ids[0] >= 0]
+
+    def search(self, query: str, k: int = 3) -> Tuple[List, Dict]:
+        """
+        :return: Top-k documents and retrieval statistics for tracing
+        """
+        started = time.perf_counter()
+        deadline = started + self.latency_budget_ms / 1000 if self.latency_budget_ms else None
+
+        dense_ids = self.dense_search(query, self.candidates)
+        if deadline is not None and time.perf_counter() > deadline:
+            sparse_ids = np.empty(0, dtype=np.int64)
+            over_budget = True
+        else:
+            sparse_ids, _ = self.bm25.search(query, self.candidates, deadline)
+            over_budget = deadline is not None and time.perf_counter() > deadline
+
+        fused, _ = reciprocal_rank_fusion([dense_ids, sparse_ids], self.rrf_k)
+        docstore_ids = self.vectorstore.index_to_docstore_id
+        documents = [self.vectorstore.docstore.search(docstore_ids[int(i)]) for i in fused[:k]]
+        return documents, {
+            "dense_hits": int(len(dense_ids)),
+            "sparse_hits": int(len(sparse_ids)),
+            "over_budget": over_budget,
+        }
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    """Word n-grams of lower-cased text, ignoring punctuation and whitespace"""
+    words = TOKEN_RE.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _relevant_positions(context: str, texts: List[str], min_overlap: float = 0.5) -> set:
+    """
+    Chunks whose text makes up the context
+
+    Contexts are assembled from merged and trimmed chunks, so a chunk counts
+    when at least min_overlap of its word 5-grams appear in the context.
+    """
+    context_shingles = _shingles(context)
+    relevant = set()
+    for i, text in enumerate(texts):
+        shingles = _shingles(text)
+        if shingles and len(shingles & context_shingles) / len(shingles) >= min_overlap:
+            relevant.add(i)
+    return relevant
+
+
+def compare_retrieval(retriever: HybridRetriever, dataset: List[Dict], k: int = 3) -> Dict[str, Dict]:
+    """
+    Compare dense, BM25 and hybrid retrieval on a generated dataset
+
+    Each conversation's topic and opening question are used as queries; the
+    chunks its "context" was assembled from count as the relevant results.
+
+    :return: recall@k, MRR and mean latency per method
+    """
+    texts = vectorstore_texts(retriever.vectorstore)
+    methods = {
+        "dense": lambda q: retriever.dense_search(q, k),
+        "bm25": lambda q: retriever.bm25.search(q, k)[0],
+        "hybrid": lambda q: reciprocal_rank_fusion(
+            [retriever.dense_search(q, retriever.candidates), retriever.bm25.search(q, retriever.candidates)[0]],
+            retriever.rrf_k,
+        )[0][:k],
+    }
+    stats = {name: {"recall": [], "reciprocal_rank": [], "latency_s": []} for name in methods}
+
+    for row in dataset:
+        relevant = _relevant_positions(row.get("context", ""), texts)
+        if not relevant:
+            continue
+        opening = next((m["content"] for m in row.get("messages", []) if m.get("role") in ("user", "assistant")), "")
+        for query in filter(None, [row.get("topic"), opening]):
+            for name, search in methods.items():
+                started = time.perf_counter()
+                ids = [int(i) for i in search(query)]
+                stats[name]["latency_s"].append(time.perf_counter() - started)
+                stats[name]["recall"].append(len(relevant & set(ids)) / min(len(relevant), k))
+                rank = next((r for r, i in enumerate(ids, start=1) if i in relevant), None)
+                stats[name]["reciprocal_rank"].append(1 / rank if rank else 0.0)
+
+    return {
+        name: {
+            "queries": len(values["recall"]),
+            f"recall_at_{k}": float(np.mean(values["recall"])) if values["recall"] else 0.0,
+            "mrr": float(np.mean(values["reciprocal_rank"])) if values["reciprocal_rank"] else 0.0,
+            "mean_latency_s": float(np.mean(values["latency_s"])) if values["latency_s"] else 0.0,
+        }
+        for name, values in stats.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare dense, BM25 and hybrid retrieval on the generated dataset")
+    parser.add_argument("document", help="PDF the dataset was generated from")
+    parser.add_argument("--dataset", default="advanced_rag_dataset.json")
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    from application import RAGAssistant
+
+    with open(args.dataset, 'r', encoding='utf-8') as f:
+        dataset = json.load(f)
+    assistant = RAGAssistant(args.document, retrieval="hybrid")
+    results = compare_retrieval(assistant.retriever, dataset, k=args.k)
+
+    print(f"\n{'method':<8} {'queries':>8} {'recall@' + str(args.k):>10} {'MRR':>7} {'latency ms':>11}")
+    for name, row in results.items():
+        print(f"{name:<8} {row['queries']:8d} {row[f'recall_at_{args.k}']:10.3f} {row['mrr']:7.3f} "
+              f"{row['mean_latency_s'] * 1000:11.2f}")
+
+
+if __name__ == "__main__":
+    main()
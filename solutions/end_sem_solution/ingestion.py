@@ -0,0 +1,161 @@
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Worker processes are started with "spawn" and re-import this module, so
+# heavy imports stay inside the functions that need them
+
+Chunk = Tuple[str, Dict]
+
+# Starting spawn workers costs about 2 s (each re-imports the text splitter)
+# while serial extraction runs at about 2 ms a page, so below this many pages
+# extraction finishes before the workers would be up
+PARALLEL_MIN_PAGES = 1000
+
+
+def _page_metadata(doc, document_path: str, page_number: int) -> Dict:
+    """Metadata in the same shape PyMuPDFLoader produces"""
+    metadata = {
+        key: value for key, value in (doc.metadata or {}).items()
+        if isinstance(value, (str, int))
+    }
+    metadata.update({
+        "source": document_path,
+        "file_path": document_path,
+        "page": page_number,
+        "total_pages": len(doc),
+    })
+    return metadata
+
+
+def _extract_chunks(document_path: str, page_numbers: List[int],
+                    chunk_size: int, chunk_overlap: int) -> List[Chunk]:
+    """Extract and split a batch of pages; runs in a worker process"""
+    import fitz
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        add_start_index=True
+    )
+    chunks = []
+    with fitz.open(document_path) as doc:
+        for page_number in page_numbers:
+            text = doc[page_number].get_text()
+            metadata = _page_metadata(doc, document_path, page_number)
+            for split in splitter.create_documents([text], metadatas=[metadata]):
+                chunks.append((split.page_content, split.metadata))
+    return chunks
+
+
+def count_pages(document_path: str) -> int:
+    import fitz
+
+    with fitz.open(document_path) as doc:
+        return len(doc)
+
+
+def iter_document_chunks(document_path: str,
+                         chunk_size: int = 500,
+                         chunk_overlap: int = 100,
+                         max_workers: Optional[int] = None,
+                         pages_per_task: int = 8) -> Iterator[Chunk]:
+    """
+    Yield (text, metadata) chunks of a PDF as its pages are extracted
+
+    Documents of PARALLEL_MIN_PAGES or more are extracted and split in
+    parallel worker processes, smaller ones in this process. Chunks are
+    yielded in page order, and only a bounded window of page batches is in
+    flight at a time, so memory stays flat for very long documents.
+
+    :param document_path: Path to the PDF
+    :param chunk_size: Characters per chunk
+    :param chunk_overlap: Characters shared by neighbouring chunks
+    :param max_workers: Worker processes, defaults to the CPU count
+    :param pages_per_task: Pages extracted per worker task
+    """
+    total_pages = count_pages(document_path)
+    batches = [
+        list(range(start, min(start + pages_per_task, total_pages)))
+        for start in range(0, total_pages, pages_per_task)
+    ]
+    workers = min(max_workers or os.cpu_count() or 1, len(batches))
+
+    # Small documents are not worth starting worker processes for
+    if workers <= 1 or total_pages < PARALLEL_MIN_PAGES:
+        for pages in batches:
+            yield from _extract_chunks(document_path, pages, chunk_size, chunk_overlap)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        pending = deque()
+        next_batch = 0
+        window = workers * 2
+        while pending or next_batch < len(batches):
+            while next_batch < len(batches) and len(pending) < window:
+                pending.append(executor.submit(
+                    _extract_chunks, document_path, batches[next_batch], chunk_size, chunk_overlap
+                ))
+                next_batch += 1
+            yield from pending.popleft().result()
+
+
+def _batched(chunks: Iterator[Chunk], size: int) -> Iterator[List[Chunk]]:
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def build_vectorstore(document_path: str,
+                      embeddings,
+                      chunk_size: int = 500,
+                      chunk_overlap: int = 100,
+                      max_workers: Optional[int] = None,
+                      embed_batch_size: int = 64):
+    """
+    Build a FAISS vectorstore from a PDF with extraction and embedding overlapped
+
+    While one batch of chunks is being embedded on a background thread, the
+    worker processes keep extracting the following pages.
+
+    :param document_path: Path to the PDF
+    :param embeddings: LangChain embeddings used for the chunks
+    :param embed_batch_size: Chunks embedded per call
+    :return: FAISS vectorstore equivalent to FAISS.from_documents on the same chunks
+    """
+    from langchain_community.vectorstores import FAISS
+
+    vectorstore = None
+
+    def add(batch: List[Chunk], vectors: List[List[float]]):
+        nonlocal vectorstore
+        texts = [text for text, _ in batch]
+        metadatas = [metadata for _, metadata in batch]
+        if vectorstore is None:
+            vectorstore = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas)
+        else:
+            vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+
+    chunks = iter_document_chunks(document_path, chunk_size, chunk_overlap, max_workers)
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed") as embedder:
+        in_flight = None
+        for batch in _batched(chunks, embed_batch_size):
+            future = embedder.submit(embeddings.embed_documents, [text for text, _ in batch])
+            if in_flight:
+                add(in_flight[0], in_flight[1].result())
+            in_flight = (batch, future)
+        if in_flight:
+            add(in_flight[0], in_flight[1].result())
+
+    if vectorstore is None:
+        raise ValueError(f"No text could be extracted from {document_path}")
+    return vectorstore
@@ -0,0 +1,95 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+
+class StartupProfile:
+    """Record how long each import and initialization step takes"""
+
+    def __init__(self):
+        self.records: List[Tuple[str, float, str]] = []
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def measure(self, label: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.records.append((label, elapsed, threading.current_thread().name))
+
+    def report(self, title: str = "Startup profile"):
+        """Print the recorded steps in the order they finished"""
+        total = time.perf_counter() - self._started
+        print(f"\n{title} ({total:.2f}s since start):")
+        with self._lock:
+            for label, elapsed, thread in self.records:
+                where = "" if thread == "MainThread" else f"  [{thread}]"
+                print(f"  {label:<45} {elapsed * 1000:9.1f} ms{where}")
+
+
+# Shared by every component in the process
+startup_profile = StartupProfile()
+
+
+def default_embeddings_factory() -> Embeddings:
+    """Build the default sentence-transformer embeddings"""
+    with startup_profile.measure("import langchain_community.embeddings"):
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+    with startup_profile.measure("load HuggingFaceEmbeddings model"):
+        return HuggingFaceEmbeddings()
+
+
+class LazyEmbeddings(Embeddings):
+    """
+    Embeddings proxy that only builds the real model on first use
+
+    Pickles without the wrapped model, so a cached vectorstore can be loaded
+    without loading the embedder.
+    """
+
+    def __init__(self, factory: Callable[[], Embeddings] = default_embeddings_factory):
+        """
+        :param factory: Picklable zero-argument callable returning the real embeddings
+        """
+        self.factory = factory
+        self._embeddings: Optional[Embeddings] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._embeddings is not None
+
+    def get(self) -> Embeddings:
+        """Return the wrapped embeddings, building them if needed"""
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = self.factory()
+        return self._embeddings
+
+    def warm_up(self) -> threading.Thread:
+        """Start building the model in the background"""
+        thread = threading.Thread(target=self.get, name="embeddings-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.get().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.get().embed_query(text)
+
+    def __getstate__(self):
+        return {"factory": self.factory}
+
+    def __setstate__(self, state):
+        self.factory = state["factory"]
+        self._embeddings = None
+        self._lock = threading.Lock()
@@ -0,0 +1,398 @@
+import os
+import time
+import asyncio
+import logging
+import argparse
+import threading
+import weakref
+from contextlib import contextmanager
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+logger = logging.getLogger(__name__)
+
+# OpenAI-compatible endpoints; every provider is called through ChatOpenAI
+DEFAULT_PROVIDERS = {
+    "openai": {"base_url": None, "model": "gpt-4o-mini"},
+    "groq": {"base_url": "https://api.groq.com/openai/v1", "model": "llama3-8b-8192"},
+}
+
+EWMA_ALPHA = 0.2
+RATE_LIMIT_COOLDOWN_S = 30.0
+ERROR_COOLDOWN_S = 10.0
+
+
+@dataclass
+class ProviderConfig:
+    name: str
+    api_key: str
+    model: str
+    base_url: Optional[str] = None
+    max_concurrency: int = 8
+    timeout: float = 60.0
+
+
+def providers_from_env(env: Dict[str, str]) -> List[ProviderConfig]:
+    """
+    Provider settings from environment variables
+
+    A provider is enabled when <NAME>_API_KEY is set; <NAME>_BASE_URL,
+    <NAME>_MODEL and <NAME>_MAX_CONCURRENCY override its defaults and
+    LLM_GATEWAY_TIMEOUT sets the request timeout in seconds.
+    """
+    timeout = float(env.get("LLM_GATEWAY_TIMEOUT", 60))
+    providers = []
+    for name, defaults in DEFAULT_PROVIDERS.items():
+        prefix = name.upper()
+        api_key = env.get(f"{prefix}_API_KEY")
+        if not api_key:
+            continue
+        providers.append(ProviderConfig(
+            name=name,
+            api_key=api_key,
+            model=env.get(f"{prefix}_MODEL", defaults["model"]),
+            base_url=env.get(f"{prefix}_BASE_URL", defaults["base_url"]),
+            max_concurrency=int(env.get(f"{prefix}_MAX_CONCURRENCY", 8)),
+            timeout=timeout,
+        ))
+    return providers
+
+
+def _cooldown_for(error: Exception) -> float:
+    """How long to avoid a provider after an error"""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return RATE_LIMIT_COOLDOWN_S
+    if status is None or status >= 500:
+        # Timeouts, connection errors and server errors
+        return ERROR_COOLDOWN_S
+    return 0.0
+
+
+class Provider:
+    """One provider's pooled clients, concurrency limit and latency statistics"""
+
+    def __init__(self, config: ProviderConfig):
+        from langchain_openai import ChatOpenAI
+
+        self.config = config
+        limits = httpx.Limits(max_connections=config.max_concurrency,
+                              max_keepalive_connections=config.max_concurrency)
+        self.http_client = httpx.Client(limits=limits, timeout=config.timeout)
+        self.chat = ChatOpenAI(
+            model=config.model, api_key=config.api_key, base_url=config.base_url,
+            http_client=self.http_client, timeout=config.timeout, max_retries=0
+        )
+        # One limit shared by sync and async calls, whatever thread or loop they run on
+        self.semaphore = threading.BoundedSemaphore(config.max_concurrency)
+        # Async clients are bound to the event loop that uses them
+        self._async = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+        self.ewma_latency_s: Optional[float] = None
+        self.unavailable_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+
+    def async_chat(self):
+        """ChatOpenAI with an async client pool for the running event loop"""
+        from langchain_openai import ChatOpenAI
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._async:
+                limits = httpx.Limits(max_connections=self.config.max_concurrency,
+                                      max_keepalive_connections=self.config.max_concurrency)
+                client = httpx.AsyncClient(limits=limits, timeout=self.config.timeout)
+                chat = ChatOpenAI(
+                    model=self.config.model, api_key=self.config.api_key, base_url=self.config.base_url,
+                    http_async_client=client, timeout=self.config.timeout, max_retries=0
+                )
+                self._async[loop] = (chat, client)
+            return self._async[loop][0]
+
+    async def acquire(self):
+        """Wait for a concurrency slot on a worker thread, without blocking the event loop"""
+        waiter = asyncio.ensure_future(asyncio.to_thread(self.semaphore.acquire))
+        try:
+            await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            # The thread keeps waiting; hand the slot back once it gets one
+            waiter.add_done_callback(self._release_abandoned)
+            raise
+
+    def _release_abandoned(self, waiter: asyncio.Future):
+        if not waiter.cancelled() and waiter.exception() is None:
+            self.semaphore.release()
+
+    @contextmanager
+    def in_flight_request(self):
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.unavailable_until
+
+    def record(self, latency_s: Optional[float] = None, error: Optional[Exception] = None):
+        with self._lock:
+            self.requests += 1
+            if error is not None:
+                self.failures += 1
+                self.unavailable_until = time.monotonic() + _cooldown_for(error)
+            elif self.ewma_latency_s is None:
+                self.ewma_latency_s = latency_s
+            else:
+                self.ewma_latency_s = EWMA_ALPHA * latency_s + (1 - EWMA_ALPHA) * self.ewma_latency_s
+
+    def stats(self) -> Dict:
+        return {
+            "model": self.config.model,
+            "requests": self.requests,
+            "failures": self.failures,
+            "in_flight": self.in_flight,
+            "ewma_latency_s": self.ewma_latency_s,
+            "available": self.available,
+        }
+
+    async def aclose(self):
+        """Close the async client pool of the running event loop"""
+        with self._lock:
+            resources = self._async.pop(asyncio.get_running_loop(), None)
+        if resources is not None:
+            await resources[1].aclose()
+
+    def close(self):
+        self.http_client.close()
+
+
+class LLMGateway:
+    """
+    Shared entry point for chat completions across providers
+
+    Requests go to the available provider with the lowest observed latency
+    (untried providers first) that has a free concurrency slot. On an error
+    the provider is put on a short cooldown and the next one is tried.
+    """
+
+    def __init__(self, providers: List[ProviderConfig]):
+        if not providers:
+            raise ValueError("No LLM providers configured; set OPENAI_API_KEY and/or GROQ_API_KEY")
+        self.providers = {config.name: Provider(config) for config in providers}
+
+    def _candidates(self, allowed: Optional[List[str]] = None) -> List[Provider]:
+        providers = [p for name, p in self.providers.items() if allowed is None or name in allowed]
+        if not providers:
+            raise ValueError(f"None of the providers {allowed} are configured")
+        ready = [p for p in providers if p.available] or providers
+        return sorted(ready, key=lambda p: p.ewma_latency_s or 0.0)
+
+    def _call_kwargs(self, provider: Provider, models: Optional[Dict[str, str]], kwargs: Dict) -> Dict:
+        if models and provider.config.name in models:
+            return {**kwargs, "model": models[provider.config.name]}
+        return kwargs
+
+    def _call(self, provider: Provider, chat, messages: List[BaseMessage],
+              models: Optional[Dict[str, str]], kwargs: Dict) -> BaseMessage:
+        with provider.in_flight_request():
+            started = time.perf_counter()
+            message = chat.invoke(messages, **self._call_kwargs(provider, models, kwargs))
+        provider.record(latency_s=time.perf_counter() - started)
+        message.response_metadata["provider"] = provider.config.name
+        return message
+
+    async def _acall(self, provider: Provider, chat, messages: List[BaseMessage],
+                     models: Optional[Dict[str, str]], kwargs: Dict) -> BaseMessage:
+        with provider.in_flight_request():
+            started = time.perf_counter()
+            message = await chat.ainvoke(messages, **self._call_kwargs(provider, models, kwargs))
+        provider.record(latency_s=time.perf_counter() - started)
+        message.response_metadata["provider"] = provider.config.name
+        return message
+
+    @staticmethod
+    def _failed(provider: Provider, error: Exception):
+        provider.record(error=error)
+        logger.warning("LLM provider %s failed (%s: %s), trying the next one",
+                       provider.config.name, type(error).__name__, error)
+
+    def invoke(self, messages: List[BaseMessage], providers: Optional[List[str]] = None,
+               models: Optional[Dict[str, str]] = None, **kwargs) -> BaseMessage:
+        """
+        Send a chat request, falling over to other providers on errors
+
+        Providers with a free concurrency slot are tried first, in latency
+        order; saturated ones are waited for only after those have failed.
+
+        :param providers: Restrict routing to these provider names
+        :param models: Per-provider model overrides
+        :param kwargs: Passed to the completion call (temperature, stop, response_format, ...)
+        """
+        error = None
+        saturated = []
+        for provider in self._candidates(providers):
+            if not provider.semaphore.acquire(blocking=False):
+                saturated.append(provider)
+                continue
+            try:
+                return self._call(provider, provider.chat, messages, models, kwargs)
+            except Exception as e:
+                error = e
+                self._failed(provider, e)
+            finally:
+                provider.semaphore.release()
+
+        for provider in saturated:
+            with provider.semaphore:
+                try:
+                    return self._call(provider, provider.chat, messages, models, kwargs)
+                except Exception as e:
+                    error = e
+                    self._failed(provider, e)
+        raise error
+
+    async def ainvoke(self, messages: List[BaseMessage], providers: Optional[List[str]] = None,
+                      models: Optional[Dict[str, str]] = None, **kwargs) -> BaseMessage:
+        """Async version of invoke"""
+        error = None
+        saturated = []
+        for provider in self._candidates(providers):
+            if not provider.semaphore.acquire(blocking=False):
+                saturated.append(provider)
+                continue
+            try:
+                return await self._acall(provider, provider.async_chat(), messages, models, kwargs)
+            except Exception as e:
+                error = e
+                self._failed(provider, e)
+            finally:
+                provider.semaphore.release()
+
+        for provider in saturated:
+            await provider.acquire()
+            try:
+                return await self._acall(provider, provider.async_chat(), messages, models, kwargs)
+            except Exception as e:
+                error = e
+                self._failed(provider, e)
+            finally:
+                provider.semaphore.release()
+        raise error
+
+    def chat_model(self, models: Optional[Dict[str, str]] = None, providers: Optional[List[str]] = None,
+                   temperature: Optional[float] = None) -> "GatewayChatModel":
+        """LangChain chat model that sends its requests through this gateway"""
+        return GatewayChatModel(gateway=self, models=models or {}, providers=providers, temperature=temperature)
+
+    def stats(self) -> Dict[str, Dict]:
+        return {name: provider.stats() for name, provider in self.providers.items()}
+
+    async def aclose(self):
+        """Close the async client pools of the running event loop; call before the loop ends"""
+        for provider in self.providers.values():
+            await provider.aclose()
+
+    def close(self):
+        for provider in self.providers.values():
+            provider.close()
+
+
+class GatewayChatModel(BaseChatModel):
+    """Chat model backed by an LLMGateway, usable wherever ChatOpenAI was"""
+
+    gateway: Any
+    models: Dict[str, str] = {}
+    providers: Optional[List[str]] = None
+    temperature: Optional[float] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "llm-gateway"
+
+    def _request_kwargs(self, stop: Optional[List[str]], kwargs: Dict) -> Dict:
+        request = dict(kwargs)
+        if stop:
+            request["stop"] = stop
+        if self.temperature is not None:
+            request.setdefault("temperature", self.temperature)
+        return request
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        message = self.gateway.invoke(
+            messages, providers=self.providers, models=self.models, **self._request_kwargs(stop, kwargs)
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs) -> ChatResult:
+        message = await self.gateway.ainvoke(
+            messages, providers=self.providers, models=self.models, **self._request_kwargs(stop, kwargs)
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+_default_gateway: Optional[LLMGateway] = None
+_default_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """Process-wide gateway configured from the environment"""
+    global _default_gateway
+    if _default_gateway is None:
+        with _default_lock:
+            if _default_gateway is None:
+                _default_gateway = LLMGateway(providers_from_env(os.environ))
+    return _default_gateway
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise the LLM gateway against local mock providers")
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    from mock_llm_server import MockLLMServer
+
+    servers = [
+        MockLLMServer("fast", latency=0.05).start(),
+        MockLLMServer("slow", latency=0.3).start(),
+        MockLLMServer("flaky", latency=0.02, failure_rate=0.3, failure_status=503).start(),
+    ]
+    gateway = LLMGateway([
+        ProviderConfig(name=s.name, api_key="mock", model="mock", base_url=s.url, max_concurrency=4)
+        for s in servers
+    ])
+    llm = gateway.chat_model()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        replies = list(pool.map(lambda i: llm.invoke(f"Question {i}"), range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    served = {}
+    for reply in replies:
+        served[reply.response_metadata["provider"]] = served.get(reply.response_metadata["provider"], 0) + 1
+    print(f"{len(replies)} requests in {elapsed:.2f}s, served by: {served}")
+    for name, stats in gateway.stats().items():
+        print(f"  {name:<6} {stats}")
+
+    gateway.close()
+    for server in servers:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
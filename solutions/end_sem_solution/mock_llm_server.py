@@ -0,0 +1,128 @@
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockLLMServer:
+    """
+    Local server speaking the OpenAI chat-completions API
+
+    Point a provider at it with <PROVIDER>_BASE_URL=<server.url> to test the
+    LLM gateway's pooling, routing and fallback without real API calls.
+    """
+
+    def __init__(self, name: str = "mock", port: int = 0, latency: float = 0.0,
+                 failure_rate: float = 0.0, failure_status: int = 429, seed: int = 0):
+        """
+        :param name: Shown in replies, so callers can tell servers apart
+        :param port: Port to listen on, 0 for any free port
+        :param latency: Seconds to wait before replying
+        :param failure_rate: Fraction of requests answered with failure_status
+        :param failure_status: HTTP status of failed requests (429, 500, 503, ...)
+        """
+        self.name = name
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def _reply(self, request: dict) -> dict:
+        messages = request.get("messages") or [{}]
+        prompt = str(messages[-1].get("content", ""))
+        if (request.get("response_format") or {}).get("type") == "json_object":
+            content = json.dumps({"server": self.name})
+        else:
+            content = f"[{self.name}] Could you explain more about: {prompt[:60]}?"
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-{self.name}-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with server._lock:
+                    server.requests += 1
+                    fail = server._random.random() < server.failure_rate
+                time.sleep(server.latency)
+
+                if fail:
+                    status = server.failure_status
+                    payload = {"error": {"message": f"{server.name} failed on purpose", "type": "mock_error"}}
+                elif not self.path.endswith("/chat/completions"):
+                    status, payload = 404, {"error": {"message": f"unknown path {self.path}"}}
+                else:
+                    status, payload = 200, server._reply(json.loads(body or b"{}"))
+
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"mock-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible chat completions server")
+    parser.add_argument("--name", default="mock")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds per request")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--failure-status", type=int, default=429)
+    args = parser.parse_args()
+
+    server = MockLLMServer(args.name, args.port, args.latency, args.failure_rate, args.failure_status).start()
+    print(f"Serving {args.name} at {server.url} (Ctrl+C to stop)")
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,19 @@
-import os
 from ragas import EvaluationDataset
-from ragas.llms import LangchainLLMWrapper
-from langchain_openai import ChatOpenAI
 from ragas.metrics import AspectCritic
 from ragas.dataset_schema import SingleTurnSample
 from ragas import evaluate
 import pandas as pd
 from dotenv import load_dotenv
 
+from evaluation_runner import METRICS, QUERY_GROUNDING_DEFINITION, default_evaluator_llm
+
 # Load environment variables
 load_dotenv()
 # Initialize evaluator
-evaluator_llm = LangchainLLMWrapper(ChatOpenAI(model="gpt-4o"))
+evaluator_llm = default_evaluator_llm(METRICS["query_grounding"].judge_model)
 critic = AspectCritic(
     name="correctness",
-    definition="Are the queries grounded in research. compare th queries with the given topic and context",
+    definition=QUERY_GROUNDING_DEFINITION,
     llm=evaluator_llm,
 )
 
@@ -0,0 +1,210 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+
+class Span:
+    """A timed stage of a turn with free-form attributes"""
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self._start_perf = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+
+    @property
+    def end_ns(self) -> int:
+        return self.start_ns + int((self.duration_ms or 0.0) * 1e6)
+
+    def set(self, **attributes):
+        """Add or overwrite attributes on the span"""
+        self.attributes.update(attributes)
+
+    def record_llm_response(self, response):
+        """Store the prompt/completion token counts reported with an LLM response"""
+        usage = getattr(response, "usage_metadata", None) or {}
+        prompt_tokens = usage.get("input_tokens")
+        completion_tokens = usage.get("output_tokens")
+        if prompt_tokens is None:
+            token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+            prompt_tokens = token_usage.get("prompt_tokens")
+            completion_tokens = token_usage.get("completion_tokens")
+        if prompt_tokens is not None:
+            self.attributes["prompt_tokens"] = self.attributes.get("prompt_tokens", 0) + prompt_tokens
+        if completion_tokens is not None:
+            self.attributes["completion_tokens"] = self.attributes.get("completion_tokens", 0) + completion_tokens
+
+    def record_rails_usage(self, rails):
+        """Add token counts of the LLM calls made by the last rails.generate, if available"""
+        try:
+            llm_calls = rails.explain().llm_calls
+        except Exception:
+            return
+        self.attributes["prompt_tokens"] = (
+            self.attributes.get("prompt_tokens", 0) + sum(call.prompt_tokens or 0 for call in llm_calls)
+        )
+        self.attributes["completion_tokens"] = (
+            self.attributes.get("completion_tokens", 0) + sum(call.completion_tokens or 0 for call in llm_calls)
+        )
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self._start_perf) * 1000
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+        }
+
+
+class TurnTrace:
+    """All spans recorded for one conversation turn"""
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.root = Span(name, attributes)
+        self.spans: List[Span] = []
+
+    def summary(self) -> Dict:
+        """Compact per-turn summary stored with the session"""
+        stages = {}
+        for span in self.spans:
+            stages[span.name] = round(stages.get(span.name, 0.0) + (span.duration_ms or 0.0), 3)
+        verdicts = {
+            span.name: span.attributes["verdict"]
+            for span in self.spans
+            if "verdict" in span.attributes
+        }
+        return {
+            "turn": self.root.name,
+            "start_ns": self.root.start_ns,
+            "total_ms": round(self.root.duration_ms or 0.0, 3),
+            "stages_ms": stages,
+            "prompt_tokens": sum(span.attributes.get("prompt_tokens", 0) for span in self.spans),
+            "completion_tokens": sum(span.attributes.get("completion_tokens", 0) for span in self.spans),
+            "cache_hits": sum(1 for span in self.spans if span.attributes.get("cache_hit")),
+            "rail_verdicts": verdicts,
+            **self.root.attributes,
+        }
+
+    def to_dict(self) -> Dict:
+        return {**self.root.to_dict(), "spans": [span.to_dict() for span in self.spans]}
+
+
+class JsonlSpanExporter:
+    """Append one JSON line per finished turn to a local file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, turn: TurnTrace):
+        line = json.dumps(turn.to_dict())
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class OpenTelemetrySpanExporter:
+    """
+    Re-emit finished turns as OpenTelemetry spans
+
+    Uses whatever tracer provider the application configured (OTLP, console,
+    ...); requires the opentelemetry-api package.
+    """
+
+    def __init__(self, service_name: str = "rag-assistant"):
+        from opentelemetry import trace
+
+        self._trace = trace
+        self._tracer = trace.get_tracer(service_name)
+
+    @staticmethod
+    def _attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+        # OpenTelemetry only accepts primitive attribute values
+        return {
+            key: value if isinstance(value, (str, bool, int, float)) else json.dumps(value)
+            for key, value in attributes.items()
+            if value is not None
+        }
+
+    def export(self, turn: TurnTrace):
+        root = self._tracer.start_span(
+            turn.root.name, start_time=turn.root.start_ns, attributes=self._attributes(turn.root.attributes)
+        )
+        context = self._trace.set_span_in_context(root)
+        for span in turn.spans:
+            child = self._tracer.start_span(
+                span.name, context=context, start_time=span.start_ns,
+                attributes=self._attributes(span.attributes)
+            )
+            child.end(end_time=span.end_ns)
+        root.end(end_time=turn.root.end_ns)
+
+
+class Tracer:
+    """Collect per-stage spans for each turn and hand finished turns to exporters"""
+
+    def __init__(self, exporters: Optional[List] = None):
+        self.exporters = list(exporters or [])
+        self._local = threading.local()
+
+    @property
+    def current_turn(self) -> Optional[TurnTrace]:
+        return getattr(self._local, "turn", None)
+
+    @contextmanager
+    def turn(self, name: str, **attributes):
+        """
+        Trace one conversation turn; spans opened inside it (on the same
+        thread) are attached to it
+
+        Yields the TurnTrace, whose summary() is available after the block.
+        """
+        trace = TurnTrace(name, attributes)
+        previous = self.current_turn
+        self._local.turn = trace
+        try:
+            yield trace
+        finally:
+            trace.root.finish()
+            self._local.turn = previous
+            for exporter in self.exporters:
+                try:
+                    exporter.export(trace)
+                except Exception as e:
+                    print(f"Failed to export trace: {e}")
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Time one stage; outside a turn the span becomes its own turn"""
+        if self.current_turn is None:
+            with self.turn(name):
+                with self.span(name, **attributes) as span:
+                    yield span
+            return
+
+        span = Span(name, attributes)
+        try:
+            yield span
+        finally:
+            span.finish()
+            self.current_turn.spans.append(span)
+
+
+def tracer_from_env(env: Dict[str, str]) -> Tracer:
+    """
+    Build a tracer from environment settings
+
+    RAG_TRACE_JSONL=<path> enables the JSONL exporter and RAG_TRACE_OTEL=1
+    the OpenTelemetry exporter.
+    """
+    exporters = []
+    if env.get("RAG_TRACE_JSONL"):
+        exporters.append(JsonlSpanExporter(env["RAG_TRACE_JSONL"]))
+    if env.get("RAG_TRACE_OTEL", "").lower() in ("1", "true", "yes"):
+        exporters.append(OpenTelemetrySpanExporter())
+    return Tracer(exporters)
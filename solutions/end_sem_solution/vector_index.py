@@ -0,0 +1,408 @@
+import os
+import math
+import time
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+STORAGE_TYPES = ("float32", "fp16", "int8", "pq")
+
+# Build-time parameters change the index and are part of the cache key;
+# search-time parameters can be changed on a loaded index
+DEFAULT_INDEX_PARAMS = {
+    "flat": {},
+    "ivf": {"nlist": None, "nprobe": 8},
+    "hnsw": {"M": 32, "efConstruction": 80, "efSearch": 64},
+}
+BUILD_PARAMS = {"flat": (), "ivf": ("nlist",), "hnsw": ("M", "efConstruction")}
+SEARCH_PARAMS = {"flat": (), "ivf": ("nprobe",), "hnsw": ("efSearch",)}
+
+# How vectors are stored in any index type. "rerank" re-scores rerank * k
+# candidates against the exact float32 vectors, which are then kept in a
+# memory-mapped file next to the index
+DEFAULT_STORAGE_PARAMS = {"storage": "float32", "pq_m": 16, "pq_nbits": 8, "rerank": 0}
+
+# Shorter PQ codes lose too much recall to be useful
+MIN_PQ_NBITS = 8
+# FAISS wants at least 39 training points per centroid
+MIN_TRAINING_POINTS_PER_CENTROID = 39
+
+
+def resolve_index_params(index_type: str, index_params: Optional[Dict] = None) -> Dict:
+    """
+    Merge user parameters over the defaults for an index type
+
+    :raises ValueError: For unknown index types or parameters
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    params = {**DEFAULT_INDEX_PARAMS[index_type], **DEFAULT_STORAGE_PARAMS}
+    unknown = set(index_params or {}) - set(params)
+    if unknown:
+        raise ValueError(f"Unknown parameters for {index_type} index: {sorted(unknown)}")
+    params.update(index_params or {})
+    if params["storage"] not in STORAGE_TYPES:
+        raise ValueError(f"Unknown storage {params['storage']!r}, expected one of {STORAGE_TYPES}")
+    if params["rerank"] and params["storage"] == "float32":
+        raise ValueError("Re-ranking needs quantized storage (fp16, int8 or pq); float32 vectors are already exact")
+    if params["storage"] == "pq" and params["pq_nbits"] < MIN_PQ_NBITS:
+        raise ValueError(f"pq_nbits must be at least {MIN_PQ_NBITS}, got {params['pq_nbits']}")
+    return params
+
+
+def default_nlist(num_vectors: int) -> int:
+    """About 4*sqrt(n) lists, with at least 39 training points per list"""
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+
+def index_cache_tag(index_type: str, index_params: Optional[Dict] = None) -> str:
+    """Cache-file suffix identifying the build-time index configuration"""
+    params = resolve_index_params(index_type, index_params)
+    parts = [f"{name}-{params[name] if params[name] is not None else 'auto'}"
+             for name in BUILD_PARAMS[index_type]]
+    if params["storage"] == "pq":
+        parts.append(f"pq{params['pq_m']}x{params['pq_nbits']}")
+    elif params["storage"] != "float32":
+        parts.append(params["storage"])
+    if params["rerank"]:
+        # The exact vectors are only kept when re-ranking
+        parts.append("exact")
+    if index_type == "flat" and not parts:
+        # Plain flat indexes keep the original cache file name
+        return ""
+    return "_" + "_".join([index_type] + parts)
+
+
+def min_pq_vectors(params: Dict) -> int:
+    """Fewest vectors that can train the PQ codebooks of the given parameters"""
+    return MIN_TRAINING_POINTS_PER_CENTROID << params["pq_nbits"]
+
+
+def effective_index_params(index_type: str, index_params: Optional[Dict], num_vectors: int) -> Dict:
+    """
+    Parameters with the automatic (None) build parameters resolved for a corpus size
+
+    :raises ValueError: If PQ storage is requested for too few vectors to train it
+    """
+    params = resolve_index_params(index_type, index_params)
+    if index_type == "ivf" and params["nlist"] is None:
+        params["nlist"] = default_nlist(num_vectors)
+    if params["storage"] == "pq" and num_vectors < min_pq_vectors(params):
+        raise ValueError(
+            f"{params['pq_nbits']}-bit PQ needs at least {min_pq_vectors(params)} vectors to train, got "
+            f"{num_vectors}; use int8 or fp16 storage for a corpus this small"
+        )
+    return params
+
+
+def _encoding(params: Dict) -> str:
+    """index_factory code for the vector storage of effective parameters"""
+    storage = params["storage"]
+    if storage == "pq":
+        return f"PQ{params['pq_m']}x{params['pq_nbits']}"
+    return {"float32": "Flat", "fp16": "SQfp16", "int8": "SQ8"}[storage]
+
+
+class RerankingIndex:
+    """
+    Quantized FAISS index whose top candidates are re-scored exactly
+
+    The float32 vectors are read from a memory-mapped file, so they live in
+    the shared page cache instead of every process's heap. Pickles without
+    the vectors; the file is reopened on first search.
+    """
+
+    def __init__(self, index: faiss.Index, vectors_path: str, rerank: int = 0):
+        """
+        :param index: Quantized index returning candidates
+        :param vectors_path: Raw float32 file with one row per indexed vector
+        :param rerank: Candidates fetched per requested neighbour, 0 disables re-ranking
+        """
+        self.index = index
+        self.vectors_path = str(vectors_path)
+        self.rerank = rerank
+        self._vectors = None
+
+    def __getattr__(self, name):
+        # ntotal, d, metric_type, ... come from the wrapped index
+        if name == "index":
+            raise AttributeError(name)
+        return getattr(self.index, name)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        if self._vectors is None:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r").reshape(-1, self.index.d)
+        return self._vectors
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.rerank:
+            return self.index.search(queries, k)
+
+        _, candidates = self.index.search(queries, min(k * self.rerank, self.index.ntotal))
+        inner_product = self.index.metric_type == faiss.METRIC_INNER_PRODUCT
+        worst = -np.finfo(np.float32).max if inner_product else np.finfo(np.float32).max
+        distances = np.full((len(queries), k), worst, dtype=np.float32)
+        labels = np.full((len(queries), k), -1, dtype=np.int64)
+
+        for row, (query, ids) in enumerate(zip(queries, candidates)):
+            ids = np.sort(ids[ids >= 0])
+            exact = np.asarray(self.vectors[ids])
+            if inner_product:
+                scores = exact @ query
+                order = np.argsort(-scores)[:k]
+            else:
+                scores = ((exact - query) ** 2).sum(axis=1)
+                order = np.argsort(scores)[:k]
+            distances[row, :len(order)] = scores[order]
+            labels[row, :len(order)] = ids[order]
+        return distances, labels
+
+    def __getstate__(self):
+        return {"index": self.index, "vectors_path": self.vectors_path, "rerank": self.rerank}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._vectors = None
+
+
+def apply_search_params(index, index_type: str, index_params: Optional[Dict] = None):
+    """Set nprobe / efSearch / rerank on a built or unpickled index"""
+    params = resolve_index_params(index_type, index_params)
+    if isinstance(index, RerankingIndex):
+        index.rerank = params["rerank"]
+        index = index.index
+    space = faiss.ParameterSpace()
+    for name in SEARCH_PARAMS[index_type]:
+        space.set_index_parameter(index, name, params[name])
+
+
+def configure_loaded_vectorstore(vectorstore, index_type: str, index_params: Optional[Dict] = None,
+                                 vectors_path: Optional[Path] = None):
+    """
+    Apply search parameters to an unpickled vectorstore and point a
+    re-ranking index at its vectors file, wherever the cache now lives
+
+    :raises ValueError: For invalid parameters, as when the index was built
+    """
+    params = resolve_index_params(index_type, index_params)
+    if isinstance(vectorstore.index, RerankingIndex):
+        if vectors_path is not None:
+            vectorstore.index.vectors_path = str(vectors_path)
+    elif params["rerank"]:
+        # The cache tag includes re-ranking, so this is a cache from older code
+        raise ValueError("The cached index keeps no exact vectors for re-ranking; delete it to rebuild")
+    apply_search_params(vectorstore.index, index_type, index_params)
+    return vectorstore
+
+
+def index_memory_bytes(index) -> int:
+    """Size of the in-memory index; memory-mapped re-ranking vectors are not counted"""
+    if isinstance(index, RerankingIndex):
+        index = index.index
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def build_index(vectors: np.ndarray, index_type: str = "flat", index_params: Optional[Dict] = None,
+                metric: int = faiss.METRIC_L2) -> faiss.Index:
+    """
+    Build (and train, for IVF) a FAISS index over the given vectors
+
+    :param vectors: float32 array of shape (n, dim)
+    :param index_type: One of "flat", "ivf" or "hnsw"
+    :param index_params: nlist/nprobe for IVF, M/efConstruction/efSearch for HNSW,
+        storage ("float32", "fp16", "int8", "pq") and pq_m/pq_nbits for any type
+    :param metric: FAISS metric, matching the vectorstore's distance strategy
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dim = vectors.shape
+    params = effective_index_params(index_type, index_params, num_vectors)
+    encoding = _encoding(params)
+
+    if index_type == "flat":
+        index = faiss.index_factory(dim, encoding, metric)
+    elif index_type == "ivf":
+        index = faiss.index_factory(dim, f"IVF{params['nlist']},{encoding}", metric)
+    else:
+        suffix = "" if encoding == "Flat" else f"_{encoding}"
+        index = faiss.index_factory(dim, f"HNSW{params['M']}{suffix}", metric)
+        index.hnsw.efConstruction = params["efConstruction"]
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    apply_search_params(index, index_type, params)
+    return index
+
+
+def reindex_vectorstore(vectorstore, index_type: str, index_params: Optional[Dict] = None,
+                        vectors_path: Optional[Path] = None):
+    """
+    Replace the flat index of a LangChain FAISS vectorstore with an ANN
+    and/or quantized index
+
+    Vectors keep their positions, so the docstore mapping stays valid.
+
+    :param vectors_path: Where to keep the exact float32 vectors of a quantized
+        index for re-ranking; required when index_params sets rerank, and
+        only written then
+    """
+    params = resolve_index_params(index_type, index_params)
+    if not index_cache_tag(index_type, params):
+        return vectorstore
+    flat = vectorstore.index
+    vectors = flat.reconstruct_n(0, flat.ntotal)
+    index = build_index(vectors, index_type, params, metric=flat.metric_type)
+
+    if params["rerank"]:
+        if vectors_path is None:
+            raise ValueError("Re-ranking needs a vectors_path for the exact vectors")
+        vectors.astype(np.float32).tofile(vectors_path)
+        index = RerankingIndex(index, vectors_path, params["rerank"])
+    vectorstore.index = index
+    return vectorstore
+
+
+def _percentile_s(latencies: List[float], q: float) -> float:
+    return float(np.percentile(np.asarray(latencies), q))
+
+
+def recall_latency_report(vectors: np.ndarray, queries: np.ndarray,
+                          configs: List[Tuple[str, Dict]], k: int = 10) -> List[Dict]:
+    """
+    Measure recall@k and single-query latency of index configurations
+
+    Recall is measured against an exact flat index over the same vectors.
+    Configurations sharing build parameters reuse one built index.
+
+    Memory is the size of the in-memory index (re-ranking vectors are
+    memory-mapped and not counted); disk adds the exact vectors file kept
+    for re-ranking. Configurations needing more vectors than given to train
+    are skipped.
+
+    :param vectors: float32 array of indexed vectors
+    :param queries: float32 array of query vectors
+    :param configs: (index_type, index_params) pairs to evaluate
+    :param k: Number of neighbours compared
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    exact = build_index(vectors, "flat")
+    _, truth = exact.search(queries, k)
+
+    built = {}
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        vectors_path = Path(tmp) / "vectors.f32"
+        vectors.tofile(vectors_path)
+        for index_type, index_params in configs:
+            params = resolve_index_params(index_type, index_params)
+            try:
+                effective = effective_index_params(index_type, params, len(vectors))
+            except ValueError as e:
+                print(f"Skipping {index_type} {index_params}: {e}")
+                continue
+            # Re-ranking only wraps the index, so both variants share one build
+            tag = index_cache_tag(index_type, {**params, "rerank": 0})
+            if tag not in built:
+                started = time.perf_counter()
+                built[tag] = (build_index(vectors, index_type, params), time.perf_counter() - started)
+            index, build_s = built[tag]
+            if params["rerank"]:
+                index = RerankingIndex(index, vectors_path)
+            apply_search_params(index, index_type, params)
+            # Label with what was built, e.g. ivf256 for nlist=None
+            label = index_cache_tag(index_type, effective)
+            rows.append(_measure(index, queries, truth, k, index_type, params, label.lstrip("_") or "flat", build_s))
+    return rows
+
+
+def _measure(index, queries: np.ndarray, truth: np.ndarray, k: int,
+             index_type: str, params: Dict, name: str, build_s: float) -> Dict:
+    """Recall, latency, memory and disk size of one configured index"""
+
+    latencies = []
+    found = np.empty_like(truth)
+    for i in range(len(queries)):
+        started = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], k)
+        latencies.append(time.perf_counter() - started)
+        found[i] = ids[0]
+
+    hits = sum(len(set(found[i]) & set(truth[i])) for i in range(len(queries)))
+    search_params = {key: value for key, value in params.items()
+                     if key in SEARCH_PARAMS[index_type] or (key == "rerank" and value)}
+    memory_bytes = index_memory_bytes(index)
+    disk_bytes = memory_bytes
+    if isinstance(index, RerankingIndex):
+        disk_bytes += os.path.getsize(index.vectors_path)
+    return {
+        "index": name,
+        "params": search_params,
+        "build_s": build_s,
+        "memory_bytes": memory_bytes,
+        "disk_bytes": disk_bytes,
+        "bytes_per_vector": memory_bytes / index.ntotal,
+        f"recall_at_{k}": hits / (len(queries) * k),
+        "p50_s": _percentile_s(latencies, 50),
+        "p99_s": _percentile_s(latencies, 99),
+    }
+
+
+def default_sweep() -> List[Tuple[str, Dict]]:
+    """
+    Flat baseline, IVF and HNSW at several recall/latency trade-offs, and
+    each storage type with and without exact re-ranking
+    """
+    configs = [("flat", {})]
+    configs += [("ivf", {"nprobe": nprobe}) for nprobe in (1, 4, 8, 16, 64)]
+    configs += [("hnsw", {"efSearch": ef}) for ef in (16, 32, 64, 128)]
+    for storage in ("fp16", "int8", "pq"):
+        configs += [("flat", {"storage": storage}), ("flat", {"storage": storage, "rerank": 4})]
+    configs += [("ivf", {"storage": "int8", "nprobe": 16}), ("ivf", {"storage": "pq", "nprobe": 16, "rerank": 4})]
+    configs += [("hnsw", {"storage": "int8"}), ("hnsw", {"storage": "int8", "rerank": 4})]
+    return configs
+
+
+def print_report(rows: List[Dict]):
+    recall_key = next(key for key in rows[0] if key.startswith("recall_at_"))
+    print(f"\n{'index':<36} {'search params':<20} {'build s':>8} {'MiB':>8} {'disk MiB':>9} {'B/vec':>7} "
+          f"{recall_key:>12} {'p50 ms':>8} {'p99 ms':>8}")
+    for row in rows:
+        params = ",".join(f"{k}={v}" for k, v in row["params"].items()) or "-"
+        print(f"{row['index']:<36} {params:<20} {row['build_s']:8.2f} {row['memory_bytes'] / 2 ** 20:8.2f} "
+              f"{row['disk_bytes'] / 2 ** 20:9.2f} "
+              f"{row['bytes_per_vector']:7.0f} {row[recall_key]:12.3f} "
+              f"{row['p50_s'] * 1000:8.3f} {row['p99_s'] * 1000:8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall, latency and memory of FAISS index types on a document's chunks")
+    parser.add_argument("document", help="PDF to index")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours compared against the flat index")
+    parser.add_argument("--queries", type=int, default=200, help="Chunks sampled as queries")
+    args = parser.parse_args()
+
+    from ingestion import build_vectorstore
+    from lazy_loading import LazyEmbeddings
+
+    print("Embedding document...")
+    vectorstore = build_vectorstore(args.document, LazyEmbeddings())
+    vectors = vectorstore.index.reconstruct_n(0, vectorstore.index.ntotal)
+
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    # Perturb the sampled chunks so queries are not exact copies of indexed vectors
+    queries = vectors[sample] + rng.normal(scale=0.01, size=vectors[sample].shape).astype(np.float32)
+
+    print(f"{len(vectors)} vectors, {len(queries)} queries")
+    print_report(recall_latency_report(vectors, queries, default_sweep(), k=min(args.k, len(vectors))))
+
+
+if __name__ == "__main__":
+    main()
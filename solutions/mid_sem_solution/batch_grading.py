@@ -0,0 +1,283 @@
+import argparse
+import asyncio
+import csv
+import fcntl
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from langchain_core.rate_limiters import InMemoryRateLimiter
+
+import grading_pipeline
+from checkpointed_runner import open_checkpointed_grader
+from grading_pipeline import ExtractionState, build_grading_graph, prepare_reference
+
+RESULT_FIELDS = [
+    "submission_id",
+    "status",
+    "total_marks",
+    "final_class_evaluations",
+    "error",
+    "elapsed_seconds",
+    "graded_at",
+]
+
+
+class ResultWriter:
+    """Append grading results to a CSV or JSONL file as soon as they finish"""
+
+    def __init__(self, output_path: str):
+        """
+        :param output_path: Results file; the format is chosen by its suffix (.csv or .jsonl)
+        """
+        self.output_path = Path(output_path)
+        self.format = "csv" if self.output_path.suffix.lower() == ".csv" else "jsonl"
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        # Workers sharing a results file take this lock around every write
+        self.lock_path = self.output_path.with_name(self.output_path.name + ".lock")
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_rows(self) -> List[Dict]:
+        if not self.output_path.exists():
+            return []
+
+        with open(self.output_path, "r", encoding="utf-8", newline="") as f:
+            if self.format == "csv":
+                return list(csv.DictReader(f))
+            rows = []
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A partially written last line from an interrupted run
+                    continue
+            return rows
+
+    def completed_ids(self) -> Set[str]:
+        """Return the submissions that already have a successful result"""
+        return {row["submission_id"] for row in self._read_rows() if row.get("status") == "ok"}
+
+    def write(self, record: Dict):
+        """Write one result and flush it to disk immediately"""
+        with self._locked():
+            is_new = not self.output_path.exists() or self.output_path.stat().st_size == 0
+            with open(self.output_path, "a", encoding="utf-8", newline="") as f:
+                if self.format == "csv":
+                    writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+                    if is_new:
+                        writer.writeheader()
+                    row = dict(record)
+                    row["final_class_evaluations"] = json.dumps(row["final_class_evaluations"])
+                    writer.writerow(row)
+                else:
+                    f.write(json.dumps(record) + "\n")
+
+    def finalize(self):
+        """
+        Rewrite the results file with one row per submission
+
+        Resumed runs re-grade failed submissions and append their new result,
+        so only the latest row of each submission is kept.
+        """
+        with self._locked():
+            latest = {}
+            for row in self._read_rows():
+                latest.pop(row["submission_id"], None)
+                latest[row["submission_id"]] = row
+
+            tmp_path = self.output_path.with_name(self.output_path.name + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+                if self.format == "csv":
+                    writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+                    writer.writeheader()
+                    writer.writerows(latest.values())
+                else:
+                    for row in latest.values():
+                        f.write(json.dumps(row) + "\n")
+            tmp_path.replace(self.output_path)
+
+
+def read_optional(path: Path) -> Optional[str]:
+    """Read a file if it exists"""
+    return path.read_text(encoding="utf-8") if path.exists() else None
+
+
+def discover_submissions(submissions_dir: str, pattern: str) -> List[Path]:
+    """List submission files in a stable order"""
+    return sorted(p for p in Path(submissions_dir).rglob(pattern) if p.is_file())
+
+
+async def grade_one(submission: Path, submission_id: str, grade, reference: Dict,
+                    semaphore: asyncio.Semaphore, writer: ResultWriter):
+    """
+    Grade a single submission and stream its result to the writer
+
+    :param grade: Coroutine function taking the initial state and returning the
+        final state, or None when another worker owns the submission
+    """
+    async with semaphore:
+        started = time.perf_counter()
+        record = {
+            "submission_id": submission_id,
+            "status": "ok",
+            "total_marks": None,
+            "final_class_evaluations": {},
+            "error": "",
+        }
+        try:
+            state = ExtractionState(
+                student_file_content=submission.read_text(encoding="utf-8"),
+                model_file_content=reference["model_file_content"],
+                rubric_content=reference["rubric_content"],
+                question_content=reference["question_content"],
+                model_classes=reference["model_classes"],
+                class_rubric_mapping=reference["class_rubric_mapping"],
+            )
+            final_state = await grade(state)
+            if final_state is None:
+                print(f"[skipped] {submission_id}")
+                return {"submission_id": submission_id, "status": "skipped"}
+            record["total_marks"] = final_state.total_marks
+            record["final_class_evaluations"] = final_state.final_class_evaluations
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {e}"
+
+        record["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+        record["graded_at"] = datetime.now().isoformat()
+        writer.write(record)
+        print(f"[{record['status']}] {submission_id} ({record['elapsed_seconds']}s)")
+        return record
+
+
+async def grade_cohort(question_dir: str, submissions_dir: str, output_path: str,
+                       pattern: str = "*.md", concurrency: int = 8,
+                       requests_per_second: float = 1.0, model_name: str = "gpt-3.5-turbo",
+                       resume: bool = True, checkpoint_db: Optional[str] = None,
+                       cache_dir: Optional[str] = None) -> List[Dict]:
+    """
+    Grade every submission in a folder against one question
+
+    :param question_dir: Directory with model_solution.md, rubric.md and optionally question.md
+    :param submissions_dir: Directory containing one student solution per file
+    :param output_path: CSV or JSONL file the results are streamed to
+    :param pattern: Glob used to find submission files
+    :param concurrency: Number of submissions graded at the same time
+    :param requests_per_second: Global LLM request rate shared by all submissions
+    :param model_name: OpenAI model to use
+    :param resume: Skip submissions that already have a successful result
+    :param checkpoint_db: SQLite checkpoint database; when given, interrupted
+        submissions resume from their last finished node or class, and several
+        worker processes can share the same database
+    :return: Result records produced by this run
+    """
+    question_path = Path(question_dir)
+    writer = ResultWriter(output_path)
+
+    submissions = discover_submissions(submissions_dir, pattern)
+    done = writer.completed_ids() if resume else set()
+    pending = [
+        (p, str(p.relative_to(submissions_dir).with_suffix("")))
+        for p in submissions
+    ]
+    pending = [(p, sid) for p, sid in pending if sid not in done]
+
+    print(f"Found {len(submissions)} submissions, {len(done)} already graded, {len(pending)} to grade")
+    if not pending:
+        return []
+
+    # One limiter for the whole cohort so concurrency never exceeds the API quota
+    rate_limiter = InMemoryRateLimiter(
+        requests_per_second=requests_per_second,
+        max_bucket_size=max(1, concurrency)
+    )
+    grading_pipeline.configure_llm(model_name, rate_limiter=rate_limiter)
+    grading_pipeline.configure_rubric_cache(cache_dir or str(question_path / ".cache"))
+
+    # Extract the model classes and rubric mapping once for the whole cohort
+    model_file_content = (question_path / "model_solution.md").read_text(encoding="utf-8")
+    rubric_content = (question_path / "rubric.md").read_text(encoding="utf-8")
+    question_content = read_optional(question_path / "question.md")
+    print("Extracting model classes and rubric mapping...")
+    model_classes, class_rubric_mapping = await prepare_reference(
+        model_file_content, rubric_content, question_content
+    )
+    reference = {
+        "model_file_content": model_file_content,
+        "rubric_content": rubric_content,
+        "question_content": question_content,
+        "model_classes": model_classes,
+        "class_rubric_mapping": class_rubric_mapping,
+    }
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    try:
+        if checkpoint_db:
+            async with open_checkpointed_grader(checkpoint_db, extract_reference=False) as grader:
+                return await asyncio.gather(*[
+                    grade_one(path, submission_id, grader.grade, reference, semaphore, writer)
+                    for path, submission_id in pending
+                ])
+
+        graph = build_grading_graph(extract_reference=False)
+
+        async def grade(state: ExtractionState) -> ExtractionState:
+            return await grading_pipeline.grade_submission(state, graph)
+
+        return await asyncio.gather(*[
+            grade_one(path, submission_id, grade, reference, semaphore, writer)
+            for path, submission_id in pending
+        ])
+    finally:
+        # Retried submissions replace their earlier error rows
+        writer.finalize()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade a cohort of student submissions against one question")
+    parser.add_argument("question_dir", help="Directory with model_solution.md, rubric.md and question.md")
+    parser.add_argument("submissions_dir", help="Directory with one student solution file per submission")
+    parser.add_argument("--output", default="grading_results.jsonl", help="Results file (.csv or .jsonl)")
+    parser.add_argument("--pattern", default="*.md", help="Glob used to find submission files")
+    parser.add_argument("--concurrency", type=int, default=8, help="Submissions graded at the same time")
+    parser.add_argument("--requests-per-second", type=float, default=1.0, help="Global LLM request rate")
+    parser.add_argument("--model", default="gpt-3.5-turbo", help="OpenAI model to use")
+    parser.add_argument("--no-resume", action="store_true", help="Regrade submissions already in the results file")
+    parser.add_argument("--checkpoint-db", help="SQLite checkpoint database shared by all workers")
+    parser.add_argument("--cache-dir", help="Directory for parsed rubrics (default: <question_dir>/.cache)")
+    args = parser.parse_args()
+
+    results = asyncio.run(grade_cohort(
+        args.question_dir,
+        args.submissions_dir,
+        args.output,
+        pattern=args.pattern,
+        concurrency=args.concurrency,
+        requests_per_second=args.requests_per_second,
+        model_name=args.model,
+        resume=not args.no_resume,
+        checkpoint_db=args.checkpoint_db,
+        cache_dir=args.cache_dir,
+    ))
+
+    graded = [r for r in results if r["status"] == "ok"]
+    failed = [r for r in results if r["status"] == "error"]
+    skipped = len(results) - len(graded) - len(failed)
+    print(f"\nGraded {len(graded)} submissions, {len(failed)} failed, {skipped} left to other workers")
+    print(f"Results file: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import os
+import socket
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import aiosqlite
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from grading_pipeline import ExtractionState, build_grading_graph
+
+# A claim not renewed for this long is assumed to belong to a crashed worker;
+# live workers renew their claims every CLAIM_HEARTBEAT_SECONDS
+CLAIM_LEASE_SECONDS = 60
+CLAIM_HEARTBEAT_SECONDS = 15
+
+
+def submission_hash(state: ExtractionState) -> str:
+    """
+    Thread id for a submission: identical inputs always map to the same
+    checkpoint, so a rerun picks up where the previous run stopped
+    """
+    hasher = hashlib.sha256()
+    for part in (state.student_file_content, state.model_file_content,
+                 state.rubric_content, state.question_content or ""):
+        hasher.update(part.encode("utf-8"))
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+class CheckpointedGrader:
+    """Run the grading graph against a SQLite checkpoint DB shared by several workers"""
+
+    def __init__(self, conn: aiosqlite.Connection, claims_conn: aiosqlite.Connection,
+                 extract_reference: bool = True):
+        """
+        :param conn: Open connection to the checkpoint database, used by the checkpointer
+        :param claims_conn: Second connection to the same database for claims, so
+            claim commits never interleave with the checkpointer's transactions
+        :param extract_reference: Passed through to build_grading_graph
+        """
+        self.conn = conn
+        self.claims_conn = claims_conn
+        self.checkpointer = AsyncSqliteSaver(conn)
+        self.graph = build_grading_graph(extract_reference, checkpointer=self.checkpointer)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._claims_lock = asyncio.Lock()
+
+    async def setup(self):
+        """Create the checkpoint and claim tables if needed"""
+        await self.checkpointer.setup()
+        await self.claims_conn.execute(
+            """CREATE TABLE IF NOT EXISTS grading_leases (
+                thread_id TEXT PRIMARY KEY,
+                claim_token TEXT NOT NULL,
+                worker_id TEXT NOT NULL,
+                renewed_at REAL NOT NULL
+            )"""
+        )
+        await self.claims_conn.commit()
+
+    async def claim(self, thread_id: str) -> Optional[str]:
+        """
+        Take ownership of a submission so no other worker grades it concurrently
+
+        Every claim gets its own token, so two coroutines of the same process
+        grading identical submissions cannot both hold it.
+
+        :return: Token identifying the claim, or None if another live claim holds it
+        """
+        token = uuid.uuid4().hex
+        async with self._claims_lock:
+            now = time.time()
+            cursor = await self.claims_conn.execute(
+                "INSERT OR IGNORE INTO grading_leases (thread_id, claim_token, worker_id, renewed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (thread_id, token, self.worker_id, now)
+            )
+            if cursor.rowcount == 0:
+                # Take over claims whose lease ran out
+                cursor = await self.claims_conn.execute(
+                    "UPDATE grading_leases SET claim_token = ?, worker_id = ?, renewed_at = ? "
+                    "WHERE thread_id = ? AND renewed_at < ?",
+                    (token, self.worker_id, now, thread_id, now - CLAIM_LEASE_SECONDS)
+                )
+            await self.claims_conn.commit()
+        return token if cursor.rowcount > 0 else None
+
+    async def renew(self, thread_id: str, token: str) -> bool:
+        """
+        Extend the lease of a claim
+
+        :return: False if the claim was lost to another worker
+        """
+        async with self._claims_lock:
+            cursor = await self.claims_conn.execute(
+                "UPDATE grading_leases SET renewed_at = ? WHERE thread_id = ? AND claim_token = ?",
+                (time.time(), thread_id, token)
+            )
+            await self.claims_conn.commit()
+        return cursor.rowcount > 0
+
+    async def release(self, thread_id: str, token: str):
+        """Drop the claim on a submission"""
+        async with self._claims_lock:
+            await self.claims_conn.execute(
+                "DELETE FROM grading_leases WHERE thread_id = ? AND claim_token = ?",
+                (thread_id, token)
+            )
+            await self.claims_conn.commit()
+
+    async def _heartbeat(self, thread_id: str, token: str):
+        """Renew a claim until cancelled"""
+        while True:
+            await asyncio.sleep(CLAIM_HEARTBEAT_SECONDS)
+            if not await self.renew(thread_id, token):
+                print(f"Lost the claim on submission {thread_id[:12]} to another worker")
+                return
+
+    async def grade(self, state: ExtractionState) -> Optional[ExtractionState]:
+        """
+        Grade a submission, resuming from its last checkpoint if there is one
+
+        :param state: Initial state for the submission
+        :return: Final state, or None if another worker is grading it right now
+        """
+        thread_id = submission_hash(state)
+        config = {"configurable": {"thread_id": thread_id}}
+
+        snapshot = await self.graph.aget_state(config)
+        if snapshot.values and not snapshot.next:
+            # Finished in an earlier run
+            return ExtractionState(**snapshot.values)
+
+        token = await self.claim(thread_id)
+        if token is None:
+            print(f"Submission {thread_id[:12]} is being graded by another worker, skipping")
+            return None
+
+        heartbeat = asyncio.create_task(self._heartbeat(thread_id, token))
+        try:
+            # Re-read after claiming in case another worker finished in between
+            snapshot = await self.graph.aget_state(config)
+            if snapshot.values and not snapshot.next:
+                return ExtractionState(**snapshot.values)
+            if snapshot.next:
+                print(f"Resuming submission {thread_id[:12]} at {', '.join(snapshot.next)}")
+                result = await self.graph.ainvoke(None, config)
+            else:
+                result = await self.graph.ainvoke(state, config)
+        finally:
+            heartbeat.cancel()
+            await self.release(thread_id, token)
+
+        return ExtractionState(**result)
+
+
+@asynccontextmanager
+async def open_checkpointed_grader(db_path: str = "grading_checkpoints.sqlite",
+                                   extract_reference: bool = True):
+    """
+    Open a CheckpointedGrader on a SQLite database
+
+    WAL mode lets several worker processes read and write the same file;
+    the busy timeout makes writers wait for each other instead of failing.
+    Claims use their own connection so they never commit the checkpointer's
+    open transaction.
+    """
+    async with aiosqlite.connect(db_path, timeout=60) as conn, \
+            aiosqlite.connect(db_path, timeout=60) as claims_conn:
+        for connection in (conn, claims_conn):
+            await connection.execute("PRAGMA journal_mode=WAL")
+            await connection.execute("PRAGMA busy_timeout=60000")
+            await connection.execute("PRAGMA synchronous=NORMAL")
+        grader = CheckpointedGrader(conn, claims_conn, extract_reference)
+        await grader.setup()
+        yield grader
@@ -0,0 +1,311 @@
+import json
+import uuid
+from dataclasses import dataclass, field
+from typing import Annotated, Any, Dict, List, Optional, Tuple, Union
+
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import Send
+from langchain_core.messages import HumanMessage
+from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.memory import MemorySaver
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from local_parsing import Number, add_marks, extract_java_classes, parse_marks
+from rubric_parser import load_rubric_index
+from structured_output import ainvoke_structured
+
+# Load environment variables
+load_dotenv()
+
+# Initialize the OpenAI LLM model
+llm = ChatOpenAI(model="gpt-3.5-turbo")
+
+
+def configure_llm(model_name: str = "gpt-3.5-turbo", rate_limiter=None) -> ChatOpenAI:
+    """
+    Replace the module-level LLM used by every grading node
+
+    :param model_name: OpenAI model to use
+    :param rate_limiter: Optional LangChain rate limiter shared by all calls
+    :return: The newly configured LLM
+    """
+    global llm
+    llm = ChatOpenAI(model=model_name, rate_limiter=rate_limiter)
+    return llm
+
+
+# Directory where parsed rubrics are cached on disk, None for in-memory only
+rubric_cache_dir: Optional[str] = None
+
+
+def configure_rubric_cache(cache_dir: Optional[str]):
+    """
+    Set the on-disk cache used when rubrics are parsed locally
+
+    :param cache_dir: Directory for parsed rubrics, None to disable the disk cache
+    """
+    global rubric_cache_dir
+    rubric_cache_dir = cache_dir
+
+
+def merge_dicts(left: Dict, right: Dict) -> Dict:
+    """Reducer that lets parallel per-class tasks each add their own entry"""
+    return {**(left or {}), **(right or {})}
+
+
+# Define the state object to store data during the workflow
+@dataclass
+class ExtractionState:
+    student_file_content: str
+    model_file_content: str
+    rubric_content: str
+    question_content: Optional[str] = None  # This is optional
+    student_classes: Dict[str, str] = field(default_factory=dict)
+    model_classes: Dict[str, str] = field(default_factory=dict)
+    class_rubric_mapping: Dict = field(default_factory=dict)
+    class_evaluations: Annotated[Dict, merge_dicts] = field(default_factory=dict)
+    final_class_evaluations: Annotated[Dict, merge_dicts] = field(default_factory=dict)
+    class_marks: Dict[str, List[Number]] = field(default_factory=dict)
+    total_marks: Optional[Union[Number, str]] = None
+
+# Class Extraction Module
+async def _llm_extract_classes(prompt: str, label: str) -> Dict[str, str]:
+    """Fallback for solutions the local parser cannot split"""
+    return await ainvoke_structured(llm, prompt, Dict[str, str], label=f"{label} classes")
+
+async def extract_student_classes(state: ExtractionState) -> ExtractionState:
+    state.student_classes = extract_java_classes(state.student_file_content)
+    if not state.student_classes:
+        prompt = f"Extract the entire Java classes from the student's solution. Return a JSON object where the key is the class name, and the value is the entire class code:\n{state.student_file_content}"
+        state.student_classes = await _llm_extract_classes(prompt, "student")
+
+    return state
+
+async def extract_model_classes(state: ExtractionState) -> ExtractionState:
+    state.model_classes = extract_java_classes(state.model_file_content)
+    if not state.model_classes:
+        prompt = f"Extract the entire Java classes from the model solution. Return a JSON object where the key is the class name, and the value is the entire class code:\n{state.model_file_content}"
+        state.model_classes = await _llm_extract_classes(prompt, "model")
+
+    return state
+
+# Rubric Extraction Module
+async def extract_rubric_for_classes(state: ExtractionState) -> ExtractionState:
+    # Rubrics follow a regular markdown layout, so they are parsed (and cached) locally
+    rubric = load_rubric_index(state.rubric_content, rubric_cache_dir)
+    if rubric.classes:
+        state.class_rubric_mapping = rubric.class_rubric_mapping()
+        return state
+
+    prompt = f"Extract the relevant rubric for evaluating the following Java classes based on the provided rubric. Return a JSON where the key is the class name and the value is the corresponding rubric criteria:\n{state.rubric_content}"
+    state.class_rubric_mapping = await ainvoke_structured(llm, prompt, Dict[str, Any], label="class rubric mapping")
+
+    return state
+
+# Initial Evaluation Module
+class CriterionEvaluation(BaseModel):
+    criterion: str
+    score: float
+    max_score: Optional[float] = None
+    feedback: str = ""
+
+class ClassEvaluation(BaseModel):
+    criterion_evaluations: List[CriterionEvaluation]
+    feedback: str = ""
+
+EVALUATION_FORMAT = (
+    "Respond with a JSON object of the form "
+    '{"criterion_evaluations": [{"criterion": "...", "score": 0, "max_score": 0, "feedback": "..."}], "feedback": "..."}, '
+    "with one entry per most specific rubric criterion so that the scores add up to the class total."
+)
+
+def format_rubric_criteria(rubric_criteria) -> str:
+    """Render the criteria of one class for a prompt"""
+    if isinstance(rubric_criteria, list) and all(isinstance(c, str) for c in rubric_criteria):
+        return "\n".join(rubric_criteria)
+    return str(rubric_criteria)
+
+def generate_evaluation_prompt(class_name: str, student_class_code: str, model_class_code: str, rubric_criteria: list) -> str:
+    return (
+        f"Evaluate the student's Java class '{class_name}' against the model class and rubric. "
+        f"**Student Class Code:**\n{student_class_code}\n\n**Model Class Code:**\n{model_class_code}\n\n"
+        f"**Rubric Criteria:**\n{format_rubric_criteria(rubric_criteria)}\n\n"
+        "Provide a detailed score for each criterion and specific feedback.\n\n"
+        f"{EVALUATION_FORMAT}"
+    )
+
+def dispatch_evaluations(state: ExtractionState) -> List:
+    """Fan out one evaluation task per class that has not been evaluated yet"""
+    sends = [
+        Send("evaluate_class", {
+            "class_name": class_name,
+            "student_class_code": student_class_code,
+            "model_class_code": state.model_classes.get(class_name, ""),
+            "rubric_criteria": state.class_rubric_mapping.get(class_name, []),
+        })
+        for class_name, student_class_code in state.student_classes.items()
+        if class_name not in state.class_evaluations
+    ]
+    return sends or ["collect_evaluations"]
+
+async def evaluate_class(task: dict) -> dict:
+    prompt = generate_evaluation_prompt(
+        task["class_name"],
+        task["student_class_code"],
+        task["model_class_code"],
+        task["rubric_criteria"]
+    )
+    # Only this class is re-requested if its reply cannot be parsed
+    evaluation = await ainvoke_structured(
+        llm, prompt, ClassEvaluation, label=f"evaluation of {task['class_name']}"
+    )
+    return {"class_evaluations": {task["class_name"]: evaluation.model_dump()}}
+
+# Review Evaluation Module
+def collect_evaluations(state: ExtractionState) -> dict:
+    """Join point that waits for every per-class evaluation task"""
+    return {}
+
+def generate_review_prompt(class_name: str, student_class_code: str, model_class_code: str, rubric_criteria: list, initial_evaluation: dict) -> str:
+    return (
+        f"Review the initial evaluation of the student's class '{class_name}' and the provided feedback. "
+        f"**Student Class Code:**\n{student_class_code}\n\n**Model Class Code:**\n{model_class_code}\n"
+        f"**Rubric Criteria:**\n{format_rubric_criteria(rubric_criteria)}\n\n"
+        f"**Initial Evaluation:**\n{json.dumps(initial_evaluation, indent=2)}\n\n"
+        "Make necessary corrections, and provide the final assessment with feedback.\n\n"
+        f"{EVALUATION_FORMAT}"
+    )
+
+def dispatch_reviews(state: ExtractionState) -> List:
+    """Fan out one review task per evaluated class that has not been reviewed yet"""
+    sends = [
+        Send("review_class", {
+            "class_name": class_name,
+            "student_class_code": state.student_classes.get(class_name, ""),
+            "model_class_code": state.model_classes.get(class_name, ""),
+            "rubric_criteria": state.class_rubric_mapping.get(class_name, []),
+            "initial_evaluation": initial_evaluation,
+        })
+        for class_name, initial_evaluation in state.class_evaluations.items()
+        if class_name not in state.final_class_evaluations
+    ]
+    return sends or ["extract_marks"]
+
+async def review_class(task: dict) -> dict:
+    prompt = generate_review_prompt(
+        task["class_name"],
+        task["student_class_code"],
+        task["model_class_code"],
+        task["rubric_criteria"],
+        task["initial_evaluation"]
+    )
+    evaluation = await ainvoke_structured(
+        llm, prompt, ClassEvaluation, label=f"review of {task['class_name']}"
+    )
+    return {"final_class_evaluations": {task["class_name"]: evaluation.model_dump()}}
+
+# Marks Extraction Module
+def extract_marks(state: ExtractionState) -> ExtractionState:
+    for class_name, evaluation in state.final_class_evaluations.items():
+        marks_list = parse_marks(evaluation)
+        if marks_list is None:
+            print(f"Could not find marks in the evaluation of {class_name}")
+            continue
+        state.class_marks[class_name] = marks_list
+        if isinstance(evaluation, dict):
+            evaluation["marks"] = ", ".join(str(mark) for mark in marks_list)
+    return state
+
+# Total Marks Calculation Module
+async def calculate_total_marks(state: ExtractionState) -> ExtractionState:
+    # Every evaluation yielded its marks, so the total is a plain sum
+    if len(state.class_marks) == len(state.final_class_evaluations):
+        state.total_marks = add_marks(
+            mark for marks_list in state.class_marks.values() for mark in marks_list
+        )
+        return state
+
+    # Otherwise let the LLM read the totals out of the free-text evaluations
+    combined_evaluations = "\n\n".join(
+        f"Class {class_name}:\n{evaluation}"
+        for class_name, evaluation in state.final_class_evaluations.items()
+    )
+    prompt = f"Calculate the total marks awarded across the following evaluations. Reply with the number only:\n{combined_evaluations}"
+    response = await llm.ainvoke([HumanMessage(content=prompt)])
+    state.total_marks = response.content
+    return state
+
+# Save Final Evaluations to a File
+def save_final_evaluations(state: ExtractionState, filename="final_evaluations.txt"):
+    with open(filename, "w") as file:
+        for class_name, evaluation in state.final_class_evaluations.items():
+            file.write(f"Class: {class_name}\n")
+            file.write(json.dumps(evaluation, indent=2))
+            file.write("\n\n")
+        file.write(f"Total Marks: {state.total_marks}\n")
+    print(f"Final evaluations and total marks saved to {filename}")
+
+# LangGraph Workflow Construction
+def build_grading_graph(extract_reference: bool = True, checkpointer=None):
+    """
+    Build the grading workflow
+
+    :param extract_reference: Whether the graph extracts the model classes and
+        rubric mapping itself. Batch runs extract them once up front and pass
+        them in through the initial state instead.
+    :param checkpointer: LangGraph checkpointer, defaults to an in-memory one
+    :return: Compiled graph
+    """
+    graph = StateGraph(ExtractionState)
+    graph.add_node("extract_student_classes", extract_student_classes)
+    graph.add_node("evaluate_class", evaluate_class)
+    graph.add_node("collect_evaluations", collect_evaluations)
+    graph.add_node("review_class", review_class)
+    graph.add_node("extract_marks", extract_marks)
+    graph.add_node("calculate_total_marks", calculate_total_marks)
+
+    # Each class is evaluated and reviewed in its own task, so a checkpointed
+    # run that fails part-way only redoes the classes that did not finish
+    graph.add_edge(START, "extract_student_classes")
+    if extract_reference:
+        graph.add_node("extract_model_classes", extract_model_classes)
+        graph.add_node("extract_rubric", extract_rubric_for_classes)
+        graph.add_edge("extract_student_classes", "extract_model_classes")
+        graph.add_edge("extract_model_classes", "extract_rubric")
+        evaluation_source = "extract_rubric"
+    else:
+        evaluation_source = "extract_student_classes"
+    graph.add_conditional_edges(evaluation_source, dispatch_evaluations, ["evaluate_class", "collect_evaluations"])
+    graph.add_edge("evaluate_class", "collect_evaluations")
+    graph.add_conditional_edges("collect_evaluations", dispatch_reviews, ["review_class", "extract_marks"])
+    graph.add_edge("review_class", "extract_marks")
+    graph.add_edge("extract_marks", "calculate_total_marks")
+    graph.add_edge("calculate_total_marks", END)
+
+    return graph.compile(checkpointer=checkpointer or MemorySaver())
+
+async def prepare_reference(model_file_content: str, rubric_content: str, question_content: Optional[str] = None) -> Tuple[Dict, Dict]:
+    """
+    Extract the model classes and the class rubric mapping once so they can be
+    shared by every submission graded against the same question
+
+    :return: Tuple of (model_classes, class_rubric_mapping)
+    """
+    state = ExtractionState("", model_file_content, rubric_content, question_content)
+    state = await extract_model_classes(state)
+    state = await extract_rubric_for_classes(state)
+    return state.model_classes, state.class_rubric_mapping
+
+async def grade_submission(state: ExtractionState, graph=None) -> ExtractionState:
+    """
+    Run the grading workflow for a single submission
+
+    :param state: Initial state; when the graph skips reference extraction it
+        must already carry model_classes and class_rubric_mapping
+    :param graph: Compiled graph, defaults to the full workflow
+    :return: Final state
+    """
+    graph = graph or build_grading_graph()
+    result = await graph.ainvoke(state, config={"configurable": {"thread_id": str(uuid.uuid4())}})
+    return ExtractionState(**result)
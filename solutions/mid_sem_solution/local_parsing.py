@@ -0,0 +1,158 @@
+import re
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+FENCED_CODE_RE = re.compile(r"```[ \t]*([\w+-]*)[^\n]*\n(.*?)```", re.DOTALL)
+TYPE_DECLARATION_RE = re.compile(r"\b(class|interface|enum|record)\s+([A-Za-z_$][\w$]*)")
+MARKS_AWARDED_RE = re.compile(
+    r"(?:marks?\s+awarded|score)[\s:*]*(-?\d+(?:\.\d+)?)\s*(?:/\s*\d+(?:\.\d+)?)?",
+    re.IGNORECASE
+)
+TOTAL_LINE_RE = re.compile(r"\btotal\b", re.IGNORECASE)
+
+Number = Union[int, float]
+
+
+def extract_code_blocks(markdown: str, language: str = "java") -> str:
+    """
+    Return the source code contained in a markdown document
+
+    Fenced blocks tagged with the requested language (or untagged) are joined;
+    when the document has no fenced blocks at all it is treated as raw code.
+    """
+    blocks = [
+        body for tag, body in FENCED_CODE_RE.findall(markdown)
+        if not tag or tag.lower() == language
+    ]
+    if not blocks and "```" not in markdown:
+        return markdown
+    return "\n".join(blocks)
+
+
+def _mask_literals(code: str) -> str:
+    """
+    Blank out comments, string and char literals while keeping offsets intact,
+    so braces and keywords inside them are ignored by the scanner
+    """
+    masked = list(code)
+    i, n = 0, len(code)
+    while i < n:
+        ch = code[i]
+        nxt = code[i + 1] if i + 1 < n else ""
+        if ch == "/" and nxt == "/":
+            end = code.find("\n", i)
+            end = n if end == -1 else end
+        elif ch == "/" and nxt == "*":
+            end = code.find("*/", i + 2)
+            end = n if end == -1 else end + 2
+        elif code.startswith('"""', i):
+            end = code.find('"""', i + 3)
+            end = n if end == -1 else end + 3
+        elif ch in "\"'":
+            end = i + 1
+            while end < n and code[end] != ch and code[end] != "\n":
+                end += 2 if code[end] == "\\" else 1
+            end = min(end + 1, n)
+        else:
+            i += 1
+            continue
+        for j in range(i, end):
+            if masked[j] != "\n":
+                masked[j] = " "
+        i = end
+    return "".join(masked)
+
+
+def _top_level_types(code: str) -> List[Tuple[str, int, int]]:
+    """Return (name, start, end) for every top-level type declaration"""
+    masked = _mask_literals(code)
+    types = []
+    depth = 0
+    statement_start = 0
+    open_type = None
+
+    for i, ch in enumerate(masked):
+        if ch == "{":
+            if depth == 0:
+                # The declaration closest to the brace; prose before it may say "class"
+                matches = list(TYPE_DECLARATION_RE.finditer(masked, statement_start, i))
+                open_type = (matches[-1].group(2), statement_start) if matches else None
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth < 0:
+                # Unbalanced input, let the caller fall back to the LLM
+                return []
+            if depth == 0:
+                if open_type:
+                    types.append((open_type[0], open_type[1], i + 1))
+                    open_type = None
+                statement_start = i + 1
+        elif ch == ";" and depth == 0:
+            statement_start = i + 1
+
+    if depth != 0:
+        return []
+    return types
+
+
+def extract_java_classes(markdown: str) -> Dict[str, str]:
+    """
+    Split the Java code of a markdown solution into its top-level classes
+
+    :param markdown: Contents of a solution file, usually a fenced java block
+    :return: Mapping of class name to the entire class code, including any
+        comment directly above it. Empty if the code cannot be parsed.
+    """
+    code = extract_code_blocks(markdown)
+    classes = {}
+    for name, start, end in _top_level_types(code):
+        classes[name] = code[start:end].strip()
+    return classes
+
+
+def _to_number(mark: Union[str, Number]) -> Number:
+    """Convert a numeric string such as "2" or "1.5" to int or float"""
+    if isinstance(mark, str):
+        mark = mark.strip()
+        return float(mark) if "." in mark else int(mark)
+    return mark
+
+
+def add_marks(marks: Iterable[Union[str, Number]]) -> Number:
+    """Add up marks given as numbers or numeric strings"""
+    total = 0
+    for mark in marks:
+        if isinstance(mark, str) and not mark.strip():
+            continue
+        total += _to_number(mark)
+    return int(total) if float(total).is_integer() else total
+
+
+def parse_marks(evaluation: Union[str, Dict]) -> Optional[List[Number]]:
+    """
+    Pull the awarded marks out of a single class evaluation
+
+    Structured evaluations carry a ``criterion_evaluations`` list with a
+    ``score`` per criterion; free-text evaluations are scanned for
+    "Marks Awarded: x/y" or "Score: x" lines. Lines that report a total are
+    skipped so section and grand totals are not counted twice.
+
+    :return: List of awarded marks, or None when none could be found
+    """
+    if isinstance(evaluation, dict):
+        criteria = evaluation.get("criterion_evaluations")
+        if criteria:
+            return [_to_number(crit.get("score", 0)) for crit in criteria]
+        if evaluation.get("marks"):
+            return [_to_number(m) for m in str(evaluation["marks"]).split(",") if m.strip()]
+        return None
+
+    marks = [
+        m
+        for line in (evaluation or "").splitlines()
+        if not TOTAL_LINE_RE.search(line)
+        for m in MARKS_AWARDED_RE.findall(line)
+    ]
+    if not marks:
+        return None
+    return [_to_number(m) for m in marks]
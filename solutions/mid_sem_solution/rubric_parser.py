@@ -0,0 +1,213 @@
+import hashlib
+import json
+import re
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*$")
+BOLD_LINE_RE = re.compile(r"^\*\*(.+?)\*\*:?\s*$")
+BULLET_RE = re.compile(r"^(\s*)[-*+]\s+(.*?)\s*$")
+RULE_RE = re.compile(r"^\s*(?:-{3,}|\*{3,}|_{3,})\s*$")
+MARKS_RE = re.compile(r"\((?:Total:\s*)?(\d+(?:\.\d+)?)\s*marks?\)", re.IGNORECASE)
+CLASS_NAME_RE = re.compile(r"([A-Za-z_$][\w$]*)\s+Class\b")
+NUMBERING_RE = re.compile(r"^(?:\d+|[a-zA-Z])\.\s+")
+
+# Bold-only lines act as headings below any markdown heading, bullets below those
+BOLD_LEVEL = 7
+BULLET_LEVEL = 10
+
+# Bump when parse_rubric or the Rubric layout changes, so stale disk caches are ignored
+RUBRIC_PARSER_VERSION = 2
+
+# Parsed rubrics shared by every grading run in this process
+_rubric_index: Dict[str, "Rubric"] = {}
+
+
+@dataclass
+class RubricCriterion:
+    title: str
+    marks: Optional[float] = None
+    children: List["RubricCriterion"] = field(default_factory=list)
+
+    @property
+    def total_marks(self) -> float:
+        """Marks stated for this criterion, or the sum of its sub-criteria"""
+        if self.marks is not None:
+            return self.marks
+        return sum(child.total_marks for child in self.children)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RubricCriterion":
+        return cls(
+            title=data["title"],
+            marks=data.get("marks"),
+            children=[cls.from_dict(child) for child in data.get("children", [])]
+        )
+
+
+@dataclass
+class ClassRubric(RubricCriterion):
+    class_name: str = ""
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ClassRubric":
+        return cls(
+            title=data["title"],
+            marks=data.get("marks"),
+            children=[RubricCriterion.from_dict(child) for child in data.get("children", [])],
+            class_name=data["class_name"]
+        )
+
+    def criteria_lines(self) -> List[str]:
+        """Flatten the criteria tree into indented bullet lines for prompts"""
+        lines = []
+
+        def walk(nodes: List[RubricCriterion], depth: int):
+            for node in nodes:
+                lines.append(f"{'  ' * depth}- {node.title} ({_format_marks(node.total_marks)})")
+                walk(node.children, depth + 1)
+
+        walk(self.children, 0)
+        return lines
+
+
+@dataclass
+class Rubric:
+    classes: List[ClassRubric] = field(default_factory=list)
+
+    @property
+    def total_marks(self) -> float:
+        return sum(class_rubric.total_marks for class_rubric in self.classes)
+
+    def class_rubric_mapping(self) -> Dict[str, List[str]]:
+        """Mapping of class name to its rubric criteria, as used by the evaluation prompts"""
+        return {
+            class_rubric.class_name: class_rubric.criteria_lines()
+            for class_rubric in self.classes
+        }
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Rubric":
+        return cls(classes=[ClassRubric.from_dict(c) for c in data.get("classes", [])])
+
+
+def _format_marks(marks: float) -> str:
+    number = str(int(marks)) if float(marks).is_integer() else str(marks)
+    return f"{number} mark" if marks == 1 else f"{number} marks"
+
+
+def _clean_title(text: str) -> str:
+    """Strip markdown emphasis, mark annotations and list numbering from a title"""
+    text = MARKS_RE.sub("", text)
+    text = text.replace("**", "").replace("*", "").strip()
+    text = NUMBERING_RE.sub("", text)
+    return text.rstrip(" :.").strip()
+
+
+def _parse_marks(text: str) -> Optional[float]:
+    match = MARKS_RE.search(text)
+    return float(match.group(1)) if match else None
+
+
+def parse_rubric(rubric_content: str) -> Rubric:
+    """
+    Parse a markdown rubric into a criteria tree per Java class
+
+    Class sections are headings that name a class ("### **Book Class ...**")
+    and run until the next horizontal rule or class heading. Inside a class,
+    sub-headings, bold-only lines and (nested) bullets become criteria, with
+    their "(N marks)" annotations as mark totals.
+    """
+    rubric = Rubric()
+    current: Optional[ClassRubric] = None
+    class_level = 0
+    stack = []
+
+    for line in rubric_content.splitlines():
+        if not line.strip():
+            continue
+
+        if RULE_RE.match(line):
+            current = None
+            continue
+
+        heading = HEADING_RE.match(line)
+        if heading:
+            level, text = len(heading.group(1)), heading.group(2)
+            class_match = CLASS_NAME_RE.search(text.replace("*", ""))
+            if class_match and (current is None or level <= class_level):
+                current = ClassRubric(
+                    title=_clean_title(text),
+                    marks=_parse_marks(text),
+                    class_name=class_match.group(1)
+                )
+                rubric.classes.append(current)
+                class_level = level
+                stack = []
+                continue
+            if current is None:
+                continue
+            if level <= class_level:
+                current = None
+                continue
+            node_level = level
+        elif current is None:
+            continue
+        elif BOLD_LINE_RE.match(line):
+            node_level, text = BOLD_LEVEL, BOLD_LINE_RE.match(line).group(1)
+        elif BULLET_RE.match(line):
+            bullet = BULLET_RE.match(line)
+            node_level = BULLET_LEVEL + len(bullet.group(1).expandtabs(4)) // 2
+            text = bullet.group(2)
+        else:
+            # Descriptive prose inside a class section carries no criteria
+            continue
+
+        node = RubricCriterion(title=_clean_title(text), marks=_parse_marks(text))
+        while stack and stack[-1][0] >= node_level:
+            stack.pop()
+        parent = stack[-1][1] if stack else current
+        parent.children.append(node)
+        stack.append((node_level, node))
+
+    return rubric
+
+
+def rubric_hash(rubric_content: str) -> str:
+    """Cache key for a rubric file"""
+    return hashlib.sha256(rubric_content.encode("utf-8")).hexdigest()
+
+
+def load_rubric_index(rubric_content: str, cache_dir: Optional[str] = None) -> Rubric:
+    """
+    Return the parsed rubric, reusing earlier parses of identical content
+
+    Parsed rubrics are kept in memory for the lifetime of the process and,
+    when a cache directory is given, cached on disk as JSON keyed by the
+    rubric's SHA-256 and the parser version.
+
+    :param rubric_content: Contents of rubric.md
+    :param cache_dir: Directory for the on-disk rubric cache, None to keep
+        parses in memory only
+    """
+    key = rubric_hash(rubric_content)
+    if key in _rubric_index:
+        return _rubric_index[key]
+
+    cache_path = Path(cache_dir) / f"rubric_v{RUBRIC_PARSER_VERSION}_{key}.json" if cache_dir else None
+    if cache_path is not None and cache_path.exists():
+        with open(cache_path, "r", encoding="utf-8") as f:
+            rubric = Rubric.from_dict(json.load(f))
+    else:
+        rubric = parse_rubric(rubric_content)
+        if cache_path is not None:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(cache_path, "w", encoding="utf-8") as f:
+                json.dump(rubric.to_dict(), f, indent=2)
+
+    _rubric_index[key] = rubric
+    return rubric
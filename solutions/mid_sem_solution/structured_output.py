@@ -0,0 +1,96 @@
+import json
+import re
+from typing import Any, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage
+from pydantic import TypeAdapter, ValidationError
+
+FENCE_RE = re.compile(r"```(?:json|JSON)?\s*\n?(.*?)```", re.DOTALL)
+
+
+class StructuredOutputError(ValueError):
+    """Raised when an LLM keeps replying with output that does not fit the schema"""
+
+
+def extract_json(text: str) -> Any:
+    """
+    Parse JSON out of an LLM reply
+
+    Accepts plain JSON, JSON wrapped in markdown fences, and JSON surrounded by
+    prose; in the last case the first complete object or array is used.
+
+    :raises ValueError: If no JSON value can be found
+    """
+    text = (text or "").strip()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+
+    for block in FENCE_RE.findall(text):
+        try:
+            return json.loads(block.strip())
+        except json.JSONDecodeError:
+            continue
+
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"[\[{]", text):
+        try:
+            value, _ = decoder.raw_decode(text, match.start())
+            return value
+        except json.JSONDecodeError:
+            continue
+
+    raise ValueError("no JSON object found in the reply")
+
+
+def parse_structured(text: str, schema: Any) -> Any:
+    """
+    Parse and validate a reply against a pydantic model or typing annotation
+
+    :return: The validated value (a model instance for pydantic models)
+    :raises ValueError: If the reply is not JSON or does not match the schema
+    """
+    data = extract_json(text)
+    try:
+        return TypeAdapter(schema).validate_python(data)
+    except ValidationError as e:
+        raise ValueError(f"reply does not match the expected schema: {e}") from e
+
+
+async def ainvoke_structured(llm, prompt: str, schema: Any, retries: int = 2,
+                             json_mode: bool = True, label: Optional[str] = None) -> Any:
+    """
+    Ask the LLM for JSON matching a schema, re-asking only on bad replies
+
+    Failed replies are sent back together with the parse error so the model
+    can correct just that answer, instead of the whole pipeline being rerun.
+
+    :param llm: Chat model to call
+    :param prompt: Prompt describing the expected JSON
+    :param schema: Pydantic model or typing annotation the reply must satisfy
+    :param retries: Number of corrective re-requests after the first attempt
+    :param json_mode: Ask the provider for a JSON object response when supported
+    :param label: Name used in error messages
+    :raises StructuredOutputError: If no valid reply is obtained
+    """
+    model = llm.bind(response_format={"type": "json_object"}) if json_mode else llm
+    messages = [HumanMessage(content=prompt)]
+    error = None
+
+    for attempt in range(retries + 1):
+        response = await model.ainvoke(messages)
+        try:
+            return parse_structured(response.content, schema)
+        except ValueError as e:
+            error = e
+            print(f"Invalid {label or 'structured'} output (attempt {attempt + 1}/{retries + 1}): {e}")
+            messages = messages + [
+                AIMessage(content=response.content),
+                HumanMessage(content=(
+                    f"Your previous reply could not be used: {e}\n"
+                    "Reply again with only the corrected JSON, no markdown or commentary."
+                )),
+            ]
+
+    raise StructuredOutputError(f"Could not get valid {label or 'structured'} output: {error}")